@@ -0,0 +1,89 @@
+"""
+    Runs calculate_alignment on a recording with every frame detected, and then with
+    adaptive sampling at several strides. Reports the time, how many frames went
+    through the detector, and how far the scale and the correction drift from the
+    exhaustive result. The detection cache is not used.
+
+    python -m benchmarks.adaptive_sampling path/to/recording path/to/reference_tags.json [farthest-pair|ransac]
+"""
+import contextlib
+import io
+import json
+import sys
+import time
+
+from pathlib import Path
+
+import numpy as np
+from scipy.spatial.transform import Rotation
+
+from tag_aligner import calculate_alignment as alignment_module
+from tag_aligner.maths import Transformation
+
+
+STRIDES = [1, 4, 8, 16, 32]
+
+
+def load_reference_tags(path):
+    with open(path, 'r') as input_file:
+        return {
+            tag_info['id']: {
+                'size': tag_info['size'],
+                'pose': Transformation(np.array(tag_info['position']), Rotation.from_quat(tag_info['rotation'])),
+            }
+            for tag_info in json.load(input_file)
+        }
+
+
+def run(recording_path, reference_tags, solver, stride):
+    detected_frames = 0
+    detect_tags_parallel = alignment_module.detect_tags_parallel
+
+    def counting_detect_tags_parallel(scan_video, frame_indices, *args, **kwargs):
+        nonlocal detected_frames
+        detected_frames += len(frame_indices)
+        return detect_tags_parallel(scan_video, frame_indices, *args, **kwargs)
+
+    alignment_module.detect_tags_parallel = counting_detect_tags_parallel
+    try:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            result = alignment_module.calculate_alignment(
+                recording_path,
+                reference_tags,
+                use_cache=False,
+                solver=solver,
+                sample_stride=stride,
+            )
+        seconds = time.perf_counter() - start
+
+    finally:
+        alignment_module.detect_tags_parallel = detect_tags_parallel
+
+    return seconds, detected_frames, result
+
+
+def correction_difference(matrix_a, matrix_b):
+    """
+        The angle in degrees and the distance between the translations of two corrective matrices
+    """
+    angle = np.degrees(Rotation.from_matrix(matrix_a[:3, :3].T @ matrix_b[:3, :3]).magnitude())
+    return angle, np.linalg.norm(matrix_a[:3, 3] - matrix_b[:3, 3])
+
+
+if __name__ == '__main__':
+    recording_path = Path(sys.argv[1])
+    reference_tags = load_reference_tags(sys.argv[2])
+    solver = sys.argv[3] if len(sys.argv) > 3 else 'farthest-pair'
+
+    print(f'{"stride":>6} {"seconds":>8} {"speedup":>8} {"frames":>7} {"scale":>9} {"scale diff":>11} {"rot diff deg":>13} {"pos diff":>9}')
+
+    reference = None
+    for stride in STRIDES:
+        seconds, detected_frames, result = run(recording_path, reference_tags, solver, stride)
+        if reference is None:
+            reference = (seconds, result)
+
+        angle, distance = correction_difference(reference[1]['corrective_matrix'], result['corrective_matrix'])
+        scale_difference = result['scale'] / reference[1]['scale'] - 1
+        print(f'{stride:>6} {seconds:8.2f} {reference[0] / seconds:7.1f}x {detected_frames:>7} {result["scale"]:9.4f} {scale_difference:+10.2%} {angle:13.3f} {distance:9.4f}')
@@ -0,0 +1,109 @@
+"""
+    Compares the per-row apply_alignment implementation with the batched one.
+
+    python -m benchmarks.apply_alignment [row_count]
+"""
+import csv
+import pickle
+import sys
+import tempfile
+import time
+
+from pathlib import Path
+
+import numpy as np
+from scipy.spatial.transform import Rotation
+
+from tag_aligner.apply_alignment import apply_alignment
+from tag_aligner.pose_files import ALIGNED_POSE_FIELDS
+from tag_aligner.maths import Transformation, rodrigues_to_rotation
+
+
+def apply_alignment_per_row(recording_path, scale, corrective_matrix):
+    pose_df = pickle.load(open(recording_path / 'poses.p', 'br'))
+
+    with (recording_path / 'aligned_poses.csv').open('w') as csv_file:
+        dict_writer = csv.DictWriter(csv_file, fieldnames=ALIGNED_POSE_FIELDS)
+        dict_writer.writeheader()
+
+        for pose in pose_df:
+            transform = Transformation(
+                np.array([pose['translation_x'], pose['translation_y'], pose['translation_z']]) * scale,
+                rodrigues_to_rotation(np.array([pose['rotation_x'], pose['rotation_y'], pose['rotation_z']]))
+            ).apply(corrective_matrix)
+
+            rotation = transform.rotation.as_quat()
+
+            dict_writer.writerow({
+                'start_timestamp': pose['start_timestamp'],
+                'end_timestamp': pose['end_timestamp'],
+                'translation_x': transform.position[0],
+                'translation_y': transform.position[1],
+                'translation_z': transform.position[2],
+                'rotation_x': rotation[0],
+                'rotation_y': rotation[1],
+                'rotation_z': rotation[2],
+                'rotation_w': rotation[3],
+            })
+
+
+def make_poses(count, rng):
+    timestamps = np.arange(count) / 30.0
+    positions = rng.normal(size=(count, 3))
+    rotations = Rotation.random(count, random_state=rng).as_rotvec()
+
+    return [
+        {
+            'start_timestamp': float(timestamp),
+            'end_timestamp': float(timestamp + 1/30.0),
+            'translation_x': float(position[0]),
+            'translation_y': float(position[1]),
+            'translation_z': float(position[2]),
+            'rotation_x': float(rotation[0]),
+            'rotation_y': float(rotation[1]),
+            'rotation_z': float(rotation[2]),
+        }
+        for timestamp, position, rotation in zip(timestamps, positions, rotations)
+    ]
+
+
+def load_csv(path):
+    return np.loadtxt(path, delimiter=',', skiprows=1)
+
+
+def time_call(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rng = np.random.default_rng(0)
+
+    scale = 1.7
+    corrective_matrix = Transformation(
+        rng.normal(size=3),
+        Rotation.random(random_state=rng),
+    ).to_matrix()
+
+    poses = make_poses(row_count, rng)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        per_row_path = Path(temp_dir) / 'per_row'
+        batched_path = Path(temp_dir) / 'batched'
+        for path in (per_row_path, batched_path):
+            path.mkdir()
+            with (path / 'poses.p').open('bw') as pose_file:
+                pickle.dump(poses, pose_file)
+
+        per_row_time = time_call(apply_alignment_per_row, per_row_path, scale, corrective_matrix)
+        batched_time = time_call(apply_alignment, batched_path, scale, corrective_matrix)
+
+        per_row = load_csv(per_row_path / 'aligned_poses.csv')
+        batched = load_csv(batched_path / 'aligned_poses.csv')
+
+    print(f'{row_count} rows')
+    print(f'per-row: {per_row_time:8.3f} s  {row_count/per_row_time:12.0f} rows/s')
+    print(f'batched: {batched_time:8.3f} s  {row_count/batched_time:12.0f} rows/s')
+    print(f'speedup: {per_row_time/batched_time:8.1f}x')
+    print(f'max abs difference: {np.max(np.abs(per_row - batched)):.3g}')
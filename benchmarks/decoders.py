@@ -0,0 +1,81 @@
+"""
+    Compares the video decoders for tag detection by frames per second and memory.
+    Every configuration decodes grayscale frames in a fresh process, once for every
+    frame and once for every 4th frame, like sampled detection reads them. Memory
+    is the growth of the peak resident set size over the process after imports.
+    The pyav backend is skipped if the av package isn't installed.
+
+    python -m benchmarks.decoders path/to/scene.mp4 [frame_count]
+"""
+import importlib.util
+import multiprocessing
+import resource
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import decord
+
+from tag_aligner.decoders import open_video
+
+
+CONFIGS = [
+    {'backend': 'decord', 'scale': 1.0, 'threads': 0},
+    {'backend': 'decord', 'scale': 0.5, 'threads': 0},
+    {'backend': 'pyav', 'scale': 1.0, 'threads': 1},
+    {'backend': 'pyav', 'scale': 1.0, 'threads': 0},
+    {'backend': 'pyav', 'scale': 0.5, 'threads': 0},
+    {'backend': 'opencv', 'scale': 1.0, 'threads': 1},
+    {'backend': 'opencv', 'scale': 1.0, 'threads': 0},
+    {'backend': 'opencv', 'scale': 0.5, 'threads': 0},
+]
+
+STRIDES = [1, 4]
+
+
+def peak_rss_mb():
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def decode(video_path, frame_indices, frame_times, decoder_params):
+    baseline = peak_rss_mb()
+
+    start = time.perf_counter()
+    video = open_video(video_path, **decoder_params)
+    checksum = 0
+    for _, frame_gray in video.read_gray(frame_indices, frame_times):
+        checksum += int(frame_gray[::64, ::64].sum())
+
+    video.close()
+    seconds = time.perf_counter() - start
+
+    return seconds, peak_rss_mb() - baseline, frame_gray.shape
+
+
+if __name__ == '__main__':
+    video_path = sys.argv[1]
+    frame_count = int(sys.argv[2]) if len(sys.argv) > 2 else 600
+
+    have_pyav = importlib.util.find_spec('av') is not None
+    spawn = multiprocessing.get_context('spawn')
+
+    video_reader = decord.VideoReader(video_path, ctx=decord.cpu(0))
+    frame_count = min(frame_count, len(video_reader))
+    all_frame_times = video_reader.get_frame_timestamp(np.arange(frame_count))[:, 0]
+    del video_reader
+
+    print(f'{"backend":<8} {"scale":>5} {"threads":>7} {"stride":>6} {"size":>10} {"fps":>8} {"memory MB":>10}')
+    for decoder_params in CONFIGS:
+        if decoder_params['backend'] == 'pyav' and not have_pyav:
+            continue
+
+        for stride in STRIDES:
+            frame_indices = np.arange(0, frame_count, stride)
+            with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as executor:
+                seconds, memory, shape = executor.submit(decode, video_path, frame_indices, all_frame_times[frame_indices], decoder_params).result()
+
+            print(f'{decoder_params["backend"]:<8} {decoder_params["scale"]:5.2f} {decoder_params["threads"] or "auto":>7} {stride:>6} {f"{shape[1]}x{shape[0]}":>10} {len(frame_indices) / seconds:8.1f} {memory:10.1f}')
@@ -0,0 +1,113 @@
+"""
+    Compares the ways of downloading and extracting a recording export, by wall time
+    and by the bytes the downloading process writes. The mock server runs in its own
+    process, so its writes to the socket aren't counted.
+
+    python -m benchmarks.download_unzip [size_mb] [--deflate]
+"""
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from pathlib import Path
+
+from downloader.cloud_api import CloudAPI
+
+
+def written_bytes():
+    with open("/proc/self/io") as io_file:
+        for line in io_file:
+            if line.startswith("wchar:"):
+                return int(line.split()[1])
+
+
+def download_legacy(api, workspace_id, recording_id, download_path):
+    # download_recording before the zip was extracted in place
+    download_path.mkdir(parents=True, exist_ok=True)
+    api.download_url(
+        f"/workspaces/{workspace_id}/recordings:raw-data-export?ids={recording_id}",
+        download_path / f"{recording_id}.zip",
+    )
+
+    shutil.unpack_archive(download_path / f"{recording_id}.zip", download_path)
+    (download_path / f"{recording_id}.zip").unlink()
+    for file_source in download_path.glob("*/*"):
+        shutil.move(file_source, file_source.parents[1] / file_source.name)
+
+    for potential_folder in download_path.glob("*"):
+        if potential_folder.is_dir():
+            potential_folder.rmdir()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_server(port, timeout=10):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            with socket.create_connection(("localhost", port), timeout=0.1):
+                return
+        except OSError:
+            time.sleep(0.05)
+
+    raise TimeoutError("mock server didn't start")
+
+
+if __name__ == "__main__":
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1].isdigit() else 256
+    deflate = "--deflate" in sys.argv
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source_path = Path(temp_dir) / "source" / "recording"
+        source_path.mkdir(parents=True)
+        with (source_path / "scene.mp4").open("wb") as video_file:
+            for _ in range(size_mb):
+                video_file.write(os.urandom(1024 * 1024))
+        (source_path / "info.json").write_text("{}")
+
+        port = free_port()
+        server_args = [sys.executable, "-m", "downloader.mock_cloud", str(source_path.parent), "--port", str(port)]
+        if deflate:
+            server_args.append("--deflate")
+
+        server = subprocess.Popen(server_args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for_server(port)
+            api = CloudAPI("key", f"http://localhost:{port}/v2")
+
+            modes = {
+                "unpack + move": lambda path: download_legacy(api, "workspace", "recording", path),
+                "extract in place": lambda path: api.download_recording("workspace", "recording", path),
+                "stream unzip": lambda path: api.download_recording("workspace", "recording", path, stream=True),
+            }
+
+            # the first request builds the export on the server
+            modes["extract in place"](Path(temp_dir) / "warmup")
+
+            print(f"{size_mb} MiB recording, {'deflated' if deflate else 'stored'} export")
+            print(f'{"mode":<18} {"seconds":>8} {"MiB written":>12}')
+            for name, download in modes.items():
+                download_path = Path(temp_dir) / name.replace(" ", "_")
+
+                written_start = written_bytes()
+                start = time.perf_counter()
+                download(download_path)
+                seconds = time.perf_counter() - start
+                written = written_bytes() - written_start
+
+                assert (download_path / "scene.mp4").read_bytes() == (source_path / "scene.mp4").read_bytes()
+                print(f"{name:<18} {seconds:8.2f} {written / 1024**2:12.1f}")
+
+                shutil.rmtree(download_path)
+
+        finally:
+            server.terminate()
+            server.wait()
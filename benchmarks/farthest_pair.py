@@ -0,0 +1,54 @@
+"""
+    Times find_farthest_pair on camera-trajectory-like point sets of growing size.
+    The pairwise scan it replaces is only run where it finishes in reasonable time.
+
+    python -m benchmarks.farthest_pair
+"""
+import time
+
+import numpy as np
+
+from tag_aligner.maths import find_farthest_pair, point_distance
+
+
+def find_farthest_pair_pairwise(points):
+    id_a = id_b = None
+    max_distance = 0
+    for idx_a in range(len(points)):
+        for idx_b in range(idx_a+1, len(points)):
+            distance = point_distance(points[idx_a], points[idx_b])
+            if distance > max_distance:
+                max_distance = distance
+                id_a = idx_a
+                id_b = idx_b
+
+    return id_a, id_b
+
+
+def make_trajectory(count, rng):
+    # a random walk, with each position repeated like poses shared by several tags in a frame
+    steps = rng.normal(scale=0.01, size=(count//2 + 1, 3))
+    return np.repeat(np.cumsum(steps, axis=0), 2, axis=0)[:count]
+
+
+def time_call(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+
+    print(f'{"N":>9} {"hull":>10} {"pairwise":>10}')
+    for count in [1_000, 3_000, 10_000, 100_000, 1_000_000]:
+        points = make_trajectory(count, rng)
+        pair, hull_time = time_call(find_farthest_pair, points)
+
+        pairwise = '-'
+        if count <= 3_000:
+            pairwise_pair, pairwise_time = time_call(find_farthest_pair_pairwise, points)
+            assert pair == pairwise_pair, (pair, pairwise_pair)
+            pairwise = f'{pairwise_time:9.3f}s'
+
+        print(f'{count:>9} {hull_time:9.3f}s {pairwise:>10}')
@@ -0,0 +1,99 @@
+"""
+    Compares showing frames with set_image(qimage_from_frame(frame)), which scales
+    every frame while painting on the UI thread, with set_frame, which scales them
+    on the presenter's worker thread. Frames are synthetic 1600x1200 BGR images.
+
+    Reports the frames shown per second and the UI thread time per shown frame.
+    Runs without a display with QT_QPA_PLATFORM=offscreen.
+
+    python -m benchmarks.frame_presenter [frame_count] [fps]
+"""
+import sys
+import time
+
+import numpy as np
+
+from PySide6.QtWidgets import QApplication
+
+from tag_aligner.scaled_image_view import ScaledImageView, qimage_from_frame
+
+
+def make_frames(count, width=1600, height=1200):
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, np.newaxis]
+    base = np.stack([x + 0*y, y + 0*x, (x + y) / 2], axis=-1).astype(np.uint8)
+
+    return [np.roll(base, frame_idx * 8, axis=1) for frame_idx in range(count)]
+
+
+def run_legacy(app, view, frames, interval):
+    ui_time = 0.0
+    start = time.perf_counter()
+    for frame_idx, frame in enumerate(frames):
+        ui_start = time.perf_counter()
+        view.set_image(qimage_from_frame(frame))
+        view.repaint()
+        app.processEvents()
+        ui_time += time.perf_counter() - ui_start
+
+        # wait for the next frame, like a camera would deliver them
+        delay = start + (frame_idx + 1) * interval - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+    return time.perf_counter() - start, ui_time, len(frames)
+
+
+def run_presenter(app, view, frames, interval):
+    shown = 0
+    original_set_image = view.set_image
+
+    def counting_set_image(image):
+        nonlocal shown
+        shown += 1
+        original_set_image(image)
+
+    view.set_image = counting_set_image
+
+    ui_time = 0.0
+    start = time.perf_counter()
+    for frame_idx, frame in enumerate(frames):
+        # like the detection worker, frames are submitted from outside of the UI code
+        view.set_frame(frame)
+
+        deadline = start + (frame_idx + 1) * interval
+        while True:
+            ui_start = time.perf_counter()
+            app.processEvents()
+            ui_time += time.perf_counter() - ui_start
+
+            if time.perf_counter() >= deadline:
+                break
+
+            time.sleep(0.0005)
+
+    view.set_image = original_set_image
+    return time.perf_counter() - start, ui_time, shown
+
+
+if __name__ == '__main__':
+    frame_count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    fps = float(sys.argv[2]) if len(sys.argv) > 2 else 60.0
+
+    app = QApplication([])
+    view = ScaledImageView()
+    view.resize(960, 720)
+    view.show()
+    app.processEvents()
+
+    frames = make_frames(frame_count)
+    print(f'{frame_count} frames of 1600x1200 at {fps:g} fps into a 960x720 view')
+    print(f'{"path":<12} {"shown fps":>10} {"UI ms/frame":>12}')
+
+    for name, run in [('set_image', run_legacy), ('set_frame', run_presenter)]:
+        seconds, ui_time, shown = run(app, view, frames, 1.0 / fps)
+        print(f'{name:<12} {shown / seconds:10.1f} {1000 * ui_time / max(shown, 1):12.2f}')
+
+    presenter = view.presenter
+    print(f'presenter: {presenter.scaled_count} scaled, {presenter.dropped_count} dropped, {1000 * presenter.scaling_time / max(presenter.scaled_count, 1):.2f} ms scaling per frame')
+    view.close()
@@ -0,0 +1,108 @@
+"""
+    Compares the binary searches playback used to find gaze and pose samples with
+    TimestampIndex, for random single lookups, playback order and bulk lookups.
+
+    python -m benchmarks.timestamp_index [duration_s]
+"""
+import sys
+import time
+
+import numpy as np
+
+from tag_aligner.timestamp_index import TimestampIndex
+
+
+def find_gaze_index_by_timestamp(gazes, timestamp, omission_threshold=1/100):
+    left_idx = 0
+    right_idx = len(gazes)-1
+    while right_idx - left_idx > 1:
+        mid_idx = (left_idx + right_idx) // 2
+
+        if timestamp < gazes[mid_idx]['timestamp']:
+            right_idx = mid_idx
+        elif timestamp > gazes[mid_idx]['timestamp']:
+            left_idx = mid_idx
+        else:
+            break
+
+    if abs(timestamp-gazes[mid_idx]['timestamp']) > omission_threshold:
+        return None
+
+    return mid_idx
+
+
+def find_pose_index_by_timestamp(poses, timestamp, omission_threshold=1/15):
+    left_idx = 0
+    right_idx = len(poses)-1
+    while right_idx - left_idx > 1:
+        mid_idx = (left_idx + right_idx) // 2
+
+        if timestamp < poses[mid_idx]['start_timestamp']:
+            right_idx = mid_idx
+        elif timestamp > poses[mid_idx]['end_timestamp']:
+            left_idx = mid_idx
+        else:
+            break
+
+    mean_ts = (poses[mid_idx]['start_timestamp']+poses[mid_idx]['end_timestamp'])/2
+    if abs(timestamp-mean_ts) > omission_threshold:
+        return None
+
+    return mid_idx
+
+
+def time_per_lookup(lookup, timestamps):
+    start = time.perf_counter()
+    for timestamp in timestamps:
+        lookup(timestamp)
+
+    return (time.perf_counter() - start) / len(timestamps)
+
+
+if __name__ == '__main__':
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 3600.0
+    rng = np.random.default_rng(0)
+
+    gaze_times = np.cumsum(rng.uniform(0.004, 0.006, int(duration * 200)))
+    gaze_records = np.zeros(len(gaze_times), dtype=[('timestamp', np.float64)])
+    gaze_records['timestamp'] = gaze_times
+    gaze_dicts = [{'timestamp': float(timestamp)} for timestamp in gaze_times]
+
+    pose_starts = np.arange(int(duration * 30)) / 30
+    pose_records = np.zeros(len(pose_starts), dtype=[('start_timestamp', np.float64), ('end_timestamp', np.float64)])
+    pose_records['start_timestamp'] = pose_starts
+    pose_records['end_timestamp'] = pose_starts + 1/30
+    pose_dicts = [{'start_timestamp': float(start), 'end_timestamp': float(start + 1/30)} for start in pose_starts]
+
+    gaze_index = TimestampIndex(gaze_times)
+    pose_index = TimestampIndex(pose_records['start_timestamp'], pose_records['end_timestamp'])
+
+    random_times = rng.uniform(0, duration, 20_000)
+    # video position updates during playback, every 10 ms or so
+    playback_times = np.cumsum(rng.uniform(0.008, 0.012, 20_000))
+
+    print(f'{len(gaze_times)} gaze samples, {len(pose_starts)} poses')
+    print(f'{"lookup":<40} {"µs":>8}')
+
+    for name, timestamps in [('random', random_times), ('playback', playback_times)]:
+        rows = [
+            (f'gaze {name}, binary search on dicts', lambda t: find_gaze_index_by_timestamp(gaze_dicts, t)),
+            (f'gaze {name}, binary search on array', lambda t: find_gaze_index_by_timestamp(gaze_records, t)),
+            (f'gaze {name}, TimestampIndex', lambda t: gaze_index.nearest(t, 1/100)),
+            (f'pose {name}, binary search on dicts', lambda t: find_pose_index_by_timestamp(pose_dicts, t)),
+            (f'pose {name}, binary search on array', lambda t: find_pose_index_by_timestamp(pose_records, t)),
+            (f'pose {name}, TimestampIndex', lambda t: pose_index.nearest(t, 1/15)),
+        ]
+        for row_name, lookup in rows:
+            print(f'{row_name:<40} {time_per_lookup(lookup, timestamps) * 1e6:8.3f}')
+
+    # both widgets look up the same gaze sample for every video position
+    print(f'{"gaze playback, repeated, TimestampIndex":<40} {time_per_lookup(lambda t: (gaze_index.nearest(t, 1/100), gaze_index.nearest(t, 1/100)), playback_times) * 1e6 / 2:8.3f}')
+
+    start = time.perf_counter()
+    gaze_index.nearest_many(playback_times, 1/100)
+    print(f'{"gaze bulk, nearest_many":<40} {(time.perf_counter() - start) / len(playback_times) * 1e6:8.3f}')
+
+    start = time.perf_counter()
+    pose_index.containing_many(playback_times)
+    print(f'{"pose bulk, containing_many":<40} {(time.perf_counter() - start) / len(playback_times) * 1e6:8.3f}')
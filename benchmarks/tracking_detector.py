@@ -0,0 +1,79 @@
+"""
+    Compares full-frame AprilTag detection with TrackingDetector on a recorded video,
+    by frames per second and by how far the corners are from a full resolution
+    (quad_decimate=1) detection of the same frame.
+
+    python -m benchmarks.tracking_detector path/to/scene.mp4 [frame_count]
+"""
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from pupil_apriltags import Detector
+
+from tag_aligner.tracking_detector import TrackingDetector
+
+
+def read_gray_frames(video_path, frame_count):
+    cap = cv2.VideoCapture(str(video_path))
+    frames = []
+    while len(frames) < frame_count:
+        status, frame = cap.read()
+        if not status:
+            break
+
+        frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+
+    cap.release()
+    return frames
+
+
+def run(detect, frames):
+    detections = []
+    start = time.perf_counter()
+    for frame in frames:
+        detections.append({tag.tag_id: tag.corners for tag in detect(frame)})
+
+    return time.perf_counter() - start, detections
+
+
+def corner_errors(detections, reference):
+    errors = []
+    missed = 0
+    for frame_detections, frame_reference in zip(detections, reference):
+        for tag_id, corners in frame_reference.items():
+            if tag_id in frame_detections:
+                errors.append(np.linalg.norm(frame_detections[tag_id] - corners, axis=1).mean())
+            else:
+                missed += 1
+
+    return np.array(errors), missed
+
+
+if __name__ == '__main__':
+    video_path = sys.argv[1]
+    frame_count = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+
+    frames = read_gray_frames(video_path, frame_count)
+    print(f'{len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]}')
+
+    _, reference = run(Detector(quad_decimate=1.0).detect, frames)
+    tag_count = sum(len(frame_reference) for frame_reference in reference)
+
+    tracking_detector = TrackingDetector()
+    detectors = {
+        'Detector() full frame': Detector().detect,
+        'Detector(quad_decimate=4)': Detector(quad_decimate=4.0).detect,
+        'TrackingDetector': tracking_detector.detect,
+        'TrackingDetector, cornerSubPix': TrackingDetector(refine_corners=True).detect,
+    }
+
+    print(f'{"detector":<34} {"fps":>8} {"ms/frame":>9} {"missed":>7} {"corner error px":>16}')
+    for name, detect in detectors.items():
+        seconds, detections = run(detect, frames)
+        errors, missed = corner_errors(detections, reference)
+        print(f'{name:<34} {len(frames) / seconds:8.1f} {1000 * seconds / len(frames):9.2f} {missed:>3}/{tag_count:<3} {errors.mean():16.3f}')
+
+    print(f'TrackingDetector searched the whole frame {tracking_detector.acquisition_count} times and tracked {tracking_detector.tracking_count} times')
@@ -1,13 +1,30 @@
-import shutil
-
 import requests
+from requests.adapters import HTTPAdapter
+
+from .zip_stream import extract_flat, stream_unzip
+
+
+DOWNLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+
 
 class CloudAPI:
-    def __init__(self, key, base_url="https://api.cloud.pupil-labs.com/v2"):
+    def __init__(self, key, base_url="https://api.cloud.pupil-labs.com/v2", max_connections=8, cache=None):
+        """
+            cache is an optional MetadataCache for enrichment and recording details
+        """
         self.key = key
         self.base_url = base_url
+        self.max_connections = max_connections
+        self.cache = cache
+
+        # one keep-alive session, shared by all threads
+        self.session = requests.Session()
+        self.session.headers["api-key"] = key
+        adapter = HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
 
-    def api_get(self, path):
+    def api_get(self, path, cached=False):
         url = f"{self.base_url}{path}"
 
         def parse_response(response):
@@ -20,47 +37,144 @@ class CloudAPI:
                 error = cloud_response["message"]
                 raise Exception(error)
 
-        return parse_response(requests.get(url, headers={"api-key": self.key}))
+        if not cached or self.cache is None:
+            return parse_response(self.session.get(url))
+
+        entry = self.cache.get(url)
+        if entry is not None and self.cache.is_fresh(entry):
+            return entry["result"]
 
-    def download_url(self, path, save_path, chunk_size=128):
+        headers = {}
+        if entry is not None and entry["etag"] is not None:
+            headers["If-None-Match"] = entry["etag"]
+
+        response = self.session.get(url, headers=headers)
+        if response.status_code == 304:
+            return self.cache.touch(url, entry)["result"]
+
+        result = parse_response(response)
+        self.cache.put(url, result, response.headers.get("ETag"))
+
+        return result
+
+    def download_url(self, path, save_path, chunk_size=DOWNLOAD_CHUNK_SIZE, progress=None):
+        """
+            Downloads to save_path + ".part" first. If such a file is left over from an
+            interrupted download, only the remaining bytes are requested. The server's
+            ETag or Last-Modified for the file is kept in save_path + ".part.validator",
+            and sent with If-Range, so a file which changed in the meantime is
+            downloaded from the start instead of being appended to the old part.
+            progress is an optional tqdm instance which is shared between downloads.
+        """
         url = f"{self.base_url}{path}"
+        partial_path = save_path.with_name(save_path.name + ".part")
+        validator_path = save_path.with_name(save_path.name + ".part.validator")
+
+        offset = partial_path.stat().st_size if partial_path.exists() else 0
+        validator = validator_path.read_text() if validator_path.exists() else None
+
+        headers = {}
+        if offset > 0 and validator:
+            headers = {"Range": f"bytes={offset}-", "If-Range": validator}
+        else:
+            # without a validator, the part can't be trusted to belong to the current file
+            offset = 0
+
+        with self.session.get(url, stream=True, headers=headers) as r:
+            if r.status_code == 416:
+                total_size = r.headers.get("Content-Range", "").rpartition("/")[2]
+                if total_size == str(offset):
+                    # nothing left to download
+                    partial_path.replace(save_path)
+                    validator_path.unlink(missing_ok=True)
+                    return
+
+                # the part is longer than the file, so it can't be resumed
+                partial_path.unlink()
+                validator_path.unlink(missing_ok=True)
+                return self.download_url(path, save_path, chunk_size, progress)
+
+            r.raise_for_status()
+            if r.status_code != 206:
+                # the server ignored the range, or the file changed, so start over
+                offset = 0
+
+            validator = r.headers.get("ETag") or r.headers.get("Last-Modified")
+            if validator:
+                validator_path.write_text(validator)
+            else:
+                validator_path.unlink(missing_ok=True)
+
+            if progress is not None and "Content-Length" in r.headers:
+                with progress.get_lock():
+                    progress.total = (progress.total or 0) + int(r.headers["Content-Length"])
+                    progress.refresh()
+
+            with open(partial_path, "ab" if offset > 0 else "wb") as fd:
+                for chunk in r.iter_content(chunk_size=chunk_size):
+                    fd.write(chunk)
 
-        r = requests.get(url, stream=True, headers={"api-key": self.key})
-        with open(save_path, "wb") as fd:
-            for chunk in r.iter_content(chunk_size=chunk_size):
-                fd.write(chunk)
+                    if progress is not None:
+                        progress.update(len(chunk))
+
+        partial_path.replace(save_path)
+        validator_path.unlink(missing_ok=True)
 
     def get_recording_details(self, workspace_id, project_id, recording_id):
-        return self.api_get(f"/workspaces/{workspace_id}/recordings/{recording_id}")
+        return self.api_get(f"/workspaces/{workspace_id}/recordings/{recording_id}", cached=True)
 
     def get_enrichment_list(self, workspace_id, project_id):
         return self.api_get(f"/workspaces/{workspace_id}/projects/{project_id}/enrichments/")
 
     def get_enrichment(self, workspace_id, project_id, enrichment_id):
-        return self.api_get(f"/workspaces/{workspace_id}/projects/{project_id}/enrichments/{enrichment_id}")
+        return self.api_get(f"/workspaces/{workspace_id}/projects/{project_id}/enrichments/{enrichment_id}", cached=True)
 
     def get_camera_poses(self, workspace_id, project_id, markerless_id, recording_id):
         return self.api_get(
             f"/workspaces/{workspace_id}/markerless/{markerless_id}/recordings/{recording_id}/camera_pose.json",
         )
 
-    def download_recording(self, workspace_id, recording_id, download_path):
+    def download_recording(self, workspace_id, recording_id, download_path, progress=None, stream=False):
+        """
+            The export zip holds a single folder with the recording's files, which are
+            extracted directly into download_path.
+
+            With stream=True, files are extracted while the zip downloads, so the zip
+            itself is never written to disk. An interrupted streaming download can't
+            be resumed though.
+
+            Returns the paths of the extracted files.
+        """
         download_path.mkdir(parents=True, exist_ok=True)
+        export_path = f"/workspaces/{workspace_id}/recordings:raw-data-export?ids={recording_id}"
 
-        self.download_url(
-            f"/workspaces/{workspace_id}/recordings:raw-data-export?ids={recording_id}",
-            download_path / f"{recording_id}.zip"
-        )
+        if stream:
+            return self.stream_export(export_path, download_path, progress=progress)
 
-        shutil.unpack_archive(
-            download_path/f"{recording_id}.zip",
-            download_path
-        )
-        (download_path / f"{recording_id}.zip").unlink()
-        for file_source in (download_path).glob("*/*"):
-            file_destination = file_source.parents[1] / file_source.name
-            shutil.move(file_source, file_destination)
-
-        for potential_folder in (download_path).glob("*"):
-            if potential_folder.is_dir():
-                potential_folder.rmdir()
+        zip_path = download_path / f"{recording_id}.zip"
+        self.download_url(export_path, zip_path, progress=progress)
+
+        extracted = extract_flat(zip_path, download_path)
+        zip_path.unlink()
+
+        return extracted
+
+    def stream_export(self, path, download_path, chunk_size=DOWNLOAD_CHUNK_SIZE, progress=None):
+        url = f"{self.base_url}{path}"
+
+        with self.session.get(url, stream=True) as r:
+            r.raise_for_status()
+
+            if progress is not None and "Content-Length" in r.headers:
+                with progress.get_lock():
+                    progress.total = (progress.total or 0) + int(r.headers["Content-Length"])
+                    progress.refresh()
+
+            def chunks():
+                for chunk in r.iter_content(chunk_size=chunk_size):
+                    if progress is not None:
+                        progress.update(len(chunk))
+
+                    yield chunk
+
+            return stream_unzip(chunks(), download_path)
@@ -0,0 +1,55 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class MetadataCache:
+    """
+        Stores API results on disk, one JSON file per URL, together with the ETag the
+        server sent. Entries younger than ttl seconds are used without asking the
+        server. Older ones are revalidated with If-None-Match, which is cheap if the
+        server answers 304 Not Modified.
+    """
+    def __init__(self, cache_dir, ttl=3600):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+
+    def entry_path(self, url):
+        return self.cache_dir / f"{hashlib.sha256(url.encode()).hexdigest()}.json"
+
+    def get(self, url):
+        entry_path = self.entry_path(url)
+        try:
+            with entry_path.open("r") as entry_file:
+                entry = json.load(entry_file)
+
+        except (OSError, ValueError):
+            return None
+
+        if entry.get("url") != url:
+            return None
+
+        return entry
+
+    def is_fresh(self, entry):
+        return time.time() - entry["fetched_at"] < self.ttl
+
+    def put(self, url, result, etag=None):
+        entry = {"url": url, "etag": etag, "fetched_at": time.time(), "result": result}
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        entry_path = self.entry_path(url)
+
+        # written next to the target and renamed, so readers never see half an entry
+        temp_path = entry_path.with_name(f"{entry_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with temp_path.open("w") as entry_file:
+            json.dump(entry, entry_file)
+
+        temp_path.replace(entry_path)
+
+        return entry
+
+    def touch(self, url, entry):
+        return self.put(url, entry["result"], entry["etag"])
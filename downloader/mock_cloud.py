@@ -0,0 +1,196 @@
+"""
+    A local stand-in for the Pupil Cloud endpoints used by the downloader, for testing
+    and benchmarking without network access or an API key.
+
+    Every sub-folder of the served folder is a recording whose ID is the folder name.
+    Its files are exported as a zip on request, and its poses.p, if any, is served as
+    its camera poses. Downloads support HTTP Range and If-Range requests, and JSON
+    responses carry an ETag which is answered with 304 Not Modified when it still
+    matches.
+
+    python -m downloader.mock_cloud path/to/recordings --port 8000
+    python -m downloader.rim key workspace project enrichment recording_id --api_url http://localhost:8000/v2
+"""
+import argparse
+import hashlib
+import json
+import pickle
+import re
+import tempfile
+import threading
+import zipfile
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+
+
+class MockCloudHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        path = url.path.removeprefix("/v2")
+
+        routes = [
+            (r"/workspaces/[^/]+/projects/[^/]+/enrichments/([^/]+)", self.send_enrichment),
+            (r"/workspaces/[^/]+/recordings:raw-data-export", lambda: self.send_export(parse_qs(url.query)["ids"][0])),
+            (r"/workspaces/[^/]+/recordings/([^/]+)", self.send_recording),
+            (r"/workspaces/[^/]+/markerless/[^/]+/recordings/([^/]+)/camera_pose.json", self.send_camera_poses),
+        ]
+        for pattern, handler in routes:
+            match = re.fullmatch(pattern, path)
+            if match is not None:
+                return handler(*match.groups())
+
+        self.send_error(404)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def recording_path(self, recording_id):
+        recording_path = self.server.root / recording_id
+        if not recording_path.is_dir():
+            return None
+
+        return recording_path
+
+    def send_json(self, result, status="success"):
+        body = json.dumps({"status": status, "result": result}).encode()
+        etag = f'"{hashlib.sha256(body).hexdigest()}"'
+
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_enrichment(self, enrichment_id):
+        self.send_json({"id": enrichment_id, "args": {"markerless_id": f"markerless-{enrichment_id}"}})
+
+    def send_recording(self, recording_id):
+        recording_path = self.recording_path(recording_id)
+        if recording_path is None:
+            return self.send_error(404)
+
+        self.send_json({
+            "id": recording_id,
+            "name": recording_id,
+            "updated_at": recording_path.stat().st_mtime,
+            "size": sum(
+                file_path.stat().st_size
+                for file_path in recording_path.iterdir()
+                if file_path.is_file() and file_path.name != "poses.p"
+            ),
+        })
+
+    def send_camera_poses(self, recording_id):
+        recording_path = self.recording_path(recording_id)
+        if recording_path is None:
+            return self.send_error(404)
+
+        poses = []
+        if (recording_path / "poses.p").exists():
+            with (recording_path / "poses.p").open("br") as pose_file:
+                poses = pickle.load(pose_file)
+
+        self.send_json(poses)
+
+    def send_export(self, recording_id):
+        recording_path = self.recording_path(recording_id)
+        if recording_path is None:
+            return self.send_error(404)
+
+        export_path = self.server.export(recording_path)
+        export_stat = export_path.stat()
+        size = export_stat.st_size
+        etag = f'"{size}-{export_stat.st_mtime_ns}"'
+        start = 0
+
+        range_match = re.fullmatch(r"bytes=(\d+)-", self.headers.get("Range", ""))
+        if_range = self.headers.get("If-Range")
+        if if_range is not None and if_range != etag:
+            # the export changed since the client's part was downloaded, so send all of it
+            range_match = None
+
+        if range_match is not None:
+            start = int(range_match.group(1))
+            if start >= size:
+                self.send_response(416)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{size-1}/{size}")
+
+        else:
+            self.send_response(200)
+
+        self.send_header("Content-Type", "application/zip")
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(size - start))
+        self.end_headers()
+
+        with export_path.open("rb") as export_file:
+            export_file.seek(start)
+            while chunk := export_file.read(1 << 20):
+                self.wfile.write(chunk)
+
+
+class MockCloudServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, root, address=("localhost", 0), verbose=False, compression=zipfile.ZIP_STORED):
+        super().__init__(address, MockCloudHandler)
+
+        self.root = Path(root)
+        self.verbose = verbose
+        self.compression = compression
+        self.export_dir = tempfile.TemporaryDirectory()
+        self.export_lock = threading.Lock()
+
+    @property
+    def api_url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}/v2"
+
+    def export(self, recording_path):
+        # Like Cloud exports, files are placed in a folder inside the zip
+        export_path = Path(self.export_dir.name) / f"{recording_path.name}.zip"
+        source_time = max([recording_path.stat().st_mtime] + [file_path.stat().st_mtime for file_path in recording_path.iterdir()])
+        with self.export_lock:
+            if not export_path.exists() or export_path.stat().st_mtime < source_time:
+                with zipfile.ZipFile(export_path, "w", compression=self.compression) as export_zip:
+                    for file_path in sorted(recording_path.iterdir()):
+                        if file_path.is_file() and file_path.name != "poses.p":
+                            export_zip.write(file_path, f"{recording_path.name}/{file_path.name}")
+
+        return export_path
+
+    def server_close(self):
+        super().server_close()
+        self.export_dir.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("root", type=Path, help="folder with one sub-folder per recording")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--deflate", action="store_true", help="compress the exported files")
+    args = parser.parse_args()
+
+    compression = zipfile.ZIP_DEFLATED if args.deflate else zipfile.ZIP_STORED
+    with MockCloudServer(args.root, ("localhost", args.port), verbose=True, compression=compression) as server:
+        print("Serving", args.root, "at", server.api_url)
+        server.serve_forever()
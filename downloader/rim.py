@@ -1,13 +1,82 @@
 import argparse
 import pickle
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from tqdm import tqdm
+
+from tag_aligner.pose_files import write_pose_npy
+
 from .cloud_api import CloudAPI
+from .metadata_cache import MetadataCache
+from .sync import (
+    export_is_current,
+    load_manifest,
+    poses_are_current,
+    poses_checksum,
+    recording_files,
+    save_manifest,
+)
 
 def safe_filename(name):
     return "".join(c for c in name if c.isalpha() or c.isdigit() or c in ' -_').rstrip()
 
 
+def fetch_recording(api, args, markerless_id, rec_id):
+    """
+        Fetches the recording details and poses, and saves the poses unless --sync
+        finds them unchanged. Returns the folder the recording is downloaded to, the
+        details and the pose checksum.
+    """
+    recording = api.get_recording_details(args.workspace_id, args.project_id, rec_id)
+    recording_name = safe_filename(recording["name"])
+
+    download_path = args.destination / recording_name
+    download_path.mkdir(parents=True, exist_ok=True)
+
+    pose_file = download_path / "poses.p"
+
+    poses = api.get_camera_poses(
+        args.workspace_id,
+        args.project_id,
+        markerless_id,
+        rec_id,
+    )
+    poses_sha256 = poses_checksum(poses)
+
+    if args.sync and poses_are_current(download_path, load_manifest(download_path), poses_sha256):
+        return download_path, recording, poses_sha256
+
+    tqdm.write(f"Downloading poses to {pose_file}...")
+    with pose_file.open("bw") as output_file:
+        pickle.dump(poses, output_file)
+
+    write_pose_npy(download_path / "poses.npy", poses)
+
+    return download_path, recording, poses_sha256
+
+
+def download_recording(api, args, rec_id, download_path, recording, poses_sha256, progress):
+    """
+        Returns whether the export was downloaded, rather than found unchanged by --sync
+    """
+    manifest = load_manifest(download_path)
+    downloaded = False
+    if not args.sync or not export_is_current(download_path, manifest, rec_id, recording):
+        tqdm.write(f"Downloading recording to {download_path}...")
+        extracted = api.download_recording(args.workspace_id, rec_id, download_path, progress=progress, stream=args.stream_unzip)
+        files = recording_files(download_path, extracted)
+        downloaded = True
+
+    else:
+        files = manifest["files"]
+
+    # only written once everything is in place, so an interrupted download is repeated
+    save_manifest(download_path, rec_id, recording, poses_sha256, files)
+
+    return downloaded
+
+
 parser = argparse.ArgumentParser()
 parser.add_argument("api_key")
 parser.add_argument("workspace_id")
@@ -17,30 +86,46 @@ parser.add_argument("recording_id", nargs="+")
 
 parser.add_argument("--api_url", default="https://api.cloud.pupil-labs.com/v2")
 parser.add_argument("--destination", type=Path, default=Path("recordings"))
+parser.add_argument("--jobs", type=int, default=4, help="number of recordings downloaded at the same time")
+parser.add_argument("--stream-unzip", action="store_true", help="extract while downloading instead of saving the zip first, can't resume")
+parser.add_argument("--cache-dir", type=Path, default=None, help="where enrichment and recording details are cached, defaults to DESTINATION/.metadata_cache")
+parser.add_argument("--cache-ttl", type=float, default=None, help="seconds for which cached details are used without asking the server, defaults to 3600, or 0 with --sync")
+parser.add_argument("--no-cache", action="store_true", help="always fetch enrichment and recording details")
+parser.add_argument("--sync", action="store_true", help="skip recordings and poses which are already downloaded and unchanged")
 
 args = parser.parse_args()
 
-api = CloudAPI(args.api_key, args.api_url)
+if args.cache_ttl is None:
+    # syncing has to notice changed recordings, which a revalidation does cheaply
+    args.cache_ttl = 0 if args.sync else 3600
+
+cache = None
+if not args.no_cache:
+    cache = MetadataCache(args.cache_dir or args.destination / ".metadata_cache", args.cache_ttl)
+
+api = CloudAPI(args.api_key, args.api_url, max_connections=max(args.jobs, 1) * 2, cache=cache)
 
 
 enrichment = api.get_enrichment(args.workspace_id, args.project_id, args.enrichment_id)
-for rec_id in args.recording_id:
-    recording = api.get_recording_details(args.workspace_id, args.project_id, rec_id)
-    recording_name = safe_filename(recording["name"])
+markerless_id = enrichment['args']['markerless_id']
 
-    download_path = args.destination / recording_name
+# Details and poses are small, so they are fetched for every recording at once over
+# the pooled connections. The large exports are limited to --jobs at a time.
+with ThreadPoolExecutor(max_workers=api.max_connections) as executor:
+    fetched = list(executor.map(
+        lambda rec_id: fetch_recording(api, args, markerless_id, rec_id),
+        args.recording_id,
+    ))
 
-    print(f"Downloading recording to {download_path}...")
-    api.download_recording(args.workspace_id, rec_id, download_path)
+with tqdm(unit="B", unit_scale=True, unit_divisor=1024, desc="Total") as progress:
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        jobs = [
+            executor.submit(download_recording, api, args, rec_id, download_path, recording, poses_sha256, progress)
+            for rec_id, (download_path, recording, poses_sha256) in zip(args.recording_id, fetched)
+        ]
 
-    pose_file = download_path / "poses.p"
+        # re-raises the first error, if any
+        downloaded = [job.result() for job in jobs]
 
-    print(f"Downloading poses to {pose_file}...")
-    poses = api.get_camera_poses(
-        args.workspace_id,
-        args.project_id,
-        enrichment['args']['markerless_id'],
-        rec_id,
-    )
-    with (download_path / "poses.p").open("bw") as output_file:
-        pickle.dump(poses, output_file)
+if args.sync:
+    print(f"{sum(downloaded)} recordings downloaded, {len(downloaded) - sum(downloaded)} unchanged")
@@ -0,0 +1,84 @@
+import hashlib
+import json
+
+
+# Written into each recording folder once it is completely downloaded
+MANIFEST_FILE_NAME = ".sync.json"
+
+POSE_FILE_NAMES = ["poses.p", "poses.npy"]
+
+
+def poses_checksum(poses):
+    return hashlib.sha256(json.dumps(poses, sort_keys=True).encode()).hexdigest()
+
+
+def load_manifest(download_path):
+    try:
+        with (download_path / MANIFEST_FILE_NAME).open("r") as manifest_file:
+            return json.load(manifest_file)
+
+    except (OSError, ValueError):
+        return None
+
+
+def save_manifest(download_path, recording_id, recording, poses_sha256, files):
+    """
+        files maps the names of the files extracted from the export to their sizes,
+        see recording_files
+    """
+    manifest = {
+        "recording_id": recording_id,
+        "updated_at": recording.get("updated_at"),
+        "size": recording.get("size"),
+        "poses_sha256": poses_sha256,
+        "files": files,
+    }
+
+    temp_path = download_path / f"{MANIFEST_FILE_NAME}.tmp"
+    with temp_path.open("w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+
+    temp_path.replace(download_path / MANIFEST_FILE_NAME)
+
+    return manifest
+
+
+def recording_files(download_path, extracted_paths):
+    """
+        The size of each file extracted from the export. Files written into the
+        folder later, like aligned poses or the detection cache, aren't included,
+        so regenerating them doesn't count as a changed recording.
+    """
+    return {
+        file_path.relative_to(download_path).as_posix(): file_path.stat().st_size
+        for file_path in sorted(extracted_paths)
+    }
+
+
+def files_are_intact(download_path, manifest):
+    for file_name, size in manifest["files"].items():
+        file_path = download_path / file_name
+        if not file_path.is_file() or file_path.stat().st_size != size:
+            return False
+
+    return True
+
+
+def export_is_current(download_path, manifest, recording_id, recording):
+    """
+        Whether the files in download_path are those of the recording as it is now
+    """
+    if manifest is None or manifest["recording_id"] != recording_id:
+        return False
+
+    if manifest["updated_at"] != recording.get("updated_at") or manifest["size"] != recording.get("size"):
+        return False
+
+    return files_are_intact(download_path, manifest)
+
+
+def poses_are_current(download_path, manifest, poses_sha256):
+    if manifest is None or manifest["poses_sha256"] != poses_sha256:
+        return False
+
+    return all((download_path / file_name).is_file() for file_name in POSE_FILE_NAMES)
@@ -0,0 +1,196 @@
+import shutil
+import struct
+import zipfile
+import zlib
+
+from pathlib import PurePosixPath
+
+
+LOCAL_FILE_HEADER = b"PK\x03\x04"
+CENTRAL_DIRECTORY_HEADER = b"PK\x01\x02"
+DATA_DESCRIPTOR = b"PK\x07\x08"
+
+FLAG_ENCRYPTED = 0x01
+FLAG_DATA_DESCRIPTOR = 0x08
+
+ZIP64_EXTRA_ID = 0x0001
+ZIP64_LIMIT = 0xFFFFFFFF
+
+COPY_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def flattened_path(destination, member_name, strip_components=1):
+    """
+        Where a zip member ends up after removing its leading folders.
+        Returns None for folders and for names which would escape the destination.
+    """
+    parts = PurePosixPath(member_name).parts[strip_components:]
+    if member_name.endswith("/") or len(parts) == 0 or ".." in parts or PurePosixPath(member_name).is_absolute():
+        return None
+
+    return destination.joinpath(*parts)
+
+
+def extract_flat(zip_path, destination, strip_components=1):
+    """
+        Extracts straight to the flattened location, without moving files afterwards.
+        Returns the paths of the extracted files.
+    """
+    extracted = []
+    with zipfile.ZipFile(zip_path) as archive:
+        for member in archive.infolist():
+            target = flattened_path(destination, member.filename, strip_components)
+            if target is None:
+                continue
+
+            target.parent.mkdir(parents=True, exist_ok=True)
+            with archive.open(member) as source, target.open("wb") as output_file:
+                shutil.copyfileobj(source, output_file, COPY_CHUNK_SIZE)
+
+            extracted.append(target)
+
+    return extracted
+
+
+class ChunkReader:
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = b""
+
+    def read_some(self, size):
+        """
+            Up to size bytes, but no more than are already buffered unless the buffer is
+            empty. Returns b"" at the end of the stream.
+        """
+        if len(self.buffer) == 0:
+            self.buffer = next(self.chunks, b"")
+
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def read_exact(self, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.read_some(size - len(data))
+            if len(chunk) == 0:
+                raise EOFError(f"Zip stream ended {size - len(data)} bytes early")
+
+            data += chunk
+
+        return bytes(data)
+
+    def unread(self, data):
+        self.buffer = data + self.buffer
+
+
+def _zip64_sizes(extra, uncompressed_size, compressed_size):
+    offset = 0
+    while offset + 4 <= len(extra):
+        field_id, field_size = struct.unpack_from("<HH", extra, offset)
+        if field_id == ZIP64_EXTRA_ID:
+            values = iter(struct.unpack_from(f"<{field_size // 8}Q", extra, offset + 4))
+            if uncompressed_size == ZIP64_LIMIT:
+                uncompressed_size = next(values)
+            if compressed_size == ZIP64_LIMIT:
+                compressed_size = next(values)
+
+            return uncompressed_size, compressed_size, True
+
+        offset += 4 + field_size
+
+    return uncompressed_size, compressed_size, False
+
+
+def stream_unzip(chunks, destination, strip_components=1):
+    """
+        Extracts a zip archive from an iterable of byte chunks while they arrive, so the
+        archive itself never touches the disk. Entries are read through their local
+        headers, and the central directory at the end is ignored.
+
+        Entries must be stored or deflated. A stored entry must have its size in the
+        local header, which is the case unless it was written to an unseekable stream.
+        Returns the paths of the extracted files.
+    """
+    reader = ChunkReader(chunks)
+    extracted = []
+
+    while True:
+        signature = reader.read_some(4)
+        if len(signature) == 0:
+            break
+
+        signature += reader.read_exact(4 - len(signature))
+        if signature != LOCAL_FILE_HEADER:
+            if signature == CENTRAL_DIRECTORY_HEADER:
+                break
+
+            raise ValueError(f"Unexpected zip record {signature!r}")
+
+        (
+            _, flags, method, _, _, crc, compressed_size, uncompressed_size, name_length, extra_length
+        ) = struct.unpack("<HHHHHIIIHH", reader.read_exact(26))
+
+        name = reader.read_exact(name_length).decode("utf-8" if flags & 0x800 else "cp437")
+        extra = reader.read_exact(extra_length)
+        uncompressed_size, compressed_size, is_zip64 = _zip64_sizes(extra, uncompressed_size, compressed_size)
+
+        if flags & FLAG_ENCRYPTED:
+            raise ValueError(f"{name} is encrypted")
+
+        if method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            raise ValueError(f"{name} uses unsupported compression method {method}")
+
+        has_descriptor = bool(flags & FLAG_DATA_DESCRIPTOR)
+        if has_descriptor and method == zipfile.ZIP_STORED:
+            raise ValueError(f"{name} is stored without its size in the local header and can't be streamed")
+
+        target = flattened_path(destination, name, strip_components)
+        output_file = None
+        if target is not None:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            output_file = target.open("wb")
+
+        actual_crc = 0
+        try:
+            decompressor = zlib.decompressobj(-zlib.MAX_WBITS) if method == zipfile.ZIP_DEFLATED else None
+            remaining = None if has_descriptor else compressed_size
+
+            while True:
+                if decompressor is not None and decompressor.eof:
+                    reader.unread(decompressor.unused_data)
+                    break
+
+                if remaining == 0:
+                    break
+
+                chunk = reader.read_some(COPY_CHUNK_SIZE if remaining is None else min(remaining, COPY_CHUNK_SIZE))
+                if len(chunk) == 0:
+                    raise EOFError(f"Zip stream ended inside of {name}")
+
+                if remaining is not None:
+                    remaining -= len(chunk)
+
+                data = chunk if decompressor is None else decompressor.decompress(chunk)
+                actual_crc = zlib.crc32(data, actual_crc)
+                if output_file is not None:
+                    output_file.write(data)
+
+        finally:
+            if output_file is not None:
+                output_file.close()
+
+        if has_descriptor:
+            descriptor = reader.read_exact(4)
+            if descriptor == DATA_DESCRIPTOR:
+                descriptor = reader.read_exact(4)
+
+            crc = struct.unpack("<I", descriptor)[0]
+            reader.read_exact(16 if is_zip64 else 8)
+
+        if actual_crc != crc:
+            raise ValueError(f"CRC mismatch in {name}")
+
+        if target is not None:
+            extracted.append(target)
+
+    return extracted
@@ -1,62 +1,129 @@
+import argparse
+import contextlib
 import csv
 import json
-import pickle
-import sys
 
 from pathlib import Path
 
 import numpy as np
 
 from .maths import (
-    Transformation,
-    rodrigues_to_rotation
+    TransformationBatch,
+    rodrigues_to_rotations
 )
+from .pose_files import (
+    ALIGNED_POSE_FIELDS,
+    find_pose_file,
+    open_aligned_pose_npy,
+    open_pose_chunks,
+)
+
+
+DEFAULT_CHUNK_SIZE = 100_000
+DEFAULT_FORMATS = ['csv']
+
+
+def align_poses(positions, rotations_rod, scale, corrective_matrix):
+    """
+        positions = (N, 3) cartesian x, y, z in RIM space
+        rotations_rod = (N, 3) Rodrigues vectors in RIM space
+
+        Returns the aligned (N, 3) positions and (N, 4) x, y, z, w quaternions
+    """
+    poses = TransformationBatch(positions * scale, rodrigues_to_rotations(rotations_rod))
+    aligned = poses.apply(corrective_matrix)
+
+    return aligned.positions, aligned.rotations
+
 
+def apply_alignment(
+    recording_path,
+    scale,
+    corrective_matrix,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    formats=DEFAULT_FORMATS,
+    npy_dtype=np.float64,
+):
+    pose_count, pose_chunks = open_pose_chunks(find_pose_file(recording_path), chunk_size)
 
-def apply_alignment(recording_path, scale, corrective_matrix):
-    pose_df = pickle.load(open(recording_path / 'poses.p', 'br'))
+    # written next to the outputs and renamed once complete, so a failed run can't
+    # leave a truncated output that looks newer than the poses
+    output_paths = {output_format: recording_path / f'aligned_poses.{output_format}' for output_format in formats}
+    temp_paths = {output_format: path.with_name(path.name + '.tmp') for output_format, path in output_paths.items()}
 
-    output_file = (recording_path / 'aligned_poses.csv')
-    print('Writing', output_file)
+    try:
+        with contextlib.ExitStack() as stack:
+            writer = npy_records = None
+            if 'csv' in formats:
+                print('Writing', output_paths['csv'])
+                writer = csv.writer(stack.enter_context(temp_paths['csv'].open('w')))
+                writer.writerow(ALIGNED_POSE_FIELDS)
 
-    with output_file.open('w') as csv_file:
-        dict_writer = csv.DictWriter(csv_file, fieldnames=[
-            'start_timestamp', 'end_timestamp',
-            'translation_x', 'translation_y', 'translation_z',
-            'rotation_x', 'rotation_y', 'rotation_z', 'rotation_w',
-        ])
-        dict_writer.writeheader()
+            if 'npy' in formats:
+                print('Writing', output_paths['npy'])
+                npy_records = open_aligned_pose_npy(temp_paths['npy'], pose_count, npy_dtype)
 
-        for pose in pose_df:
-            transform = Transformation(
-                np.array([pose['translation_x'], pose['translation_y'], pose['translation_z']]) * scale,
-                rodrigues_to_rotation(np.array([pose['rotation_x'], pose['rotation_y'], pose['rotation_z']]))
-            ).apply(corrective_matrix)
+            chunk_start = 0
+            for columns in pose_chunks:
+                positions, quaternions = align_poses(
+                    np.column_stack([columns['translation_x'], columns['translation_y'], columns['translation_z']]),
+                    np.column_stack([columns['rotation_x'], columns['rotation_y'], columns['rotation_z']]),
+                    scale,
+                    corrective_matrix,
+                )
 
-            rotation = transform.rotation.as_quat()
+                rows = np.column_stack([columns['start_timestamp'], columns['end_timestamp'], positions, quaternions])
+                if writer is not None:
+                    writer.writerows(rows.tolist())
 
-            dict_writer.writerow({
-                'start_timestamp': pose['start_timestamp'],
-                'end_timestamp': pose['end_timestamp'],
-                'translation_x': transform.position[0],
-                'translation_y': transform.position[1],
-                'translation_z': transform.position[2],
-                'rotation_x': rotation[0],
-                'rotation_y': rotation[1],
-                'rotation_z': rotation[2],
-                'rotation_w': rotation[3],
-            })
+                if npy_records is not None:
+                    for column_idx, field in enumerate(ALIGNED_POSE_FIELDS):
+                        npy_records[field][chunk_start:chunk_start+len(rows)] = rows[:, column_idx]
+
+                chunk_start += len(rows)
+
+            if npy_records is not None:
+                npy_records.flush()
+
+                # the file can't be renamed while mapped on Windows
+                del npy_records
+
+        for output_format, output_path in output_paths.items():
+            temp_paths[output_format].replace(output_path)
+
+    except BaseException:
+        for temp_path in temp_paths.values():
+            temp_path.unlink(missing_ok=True)
+
+        raise
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('recording_path', type=Path)
+    parser.add_argument('alignment_file', type=Path)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='number of poses transformed at a time')
+    parser.add_argument(
+        '--formats',
+        nargs='+',
+        choices=['csv', 'npy'],
+        default=DEFAULT_FORMATS,
+        help='aligned_poses.csv (the default) and/or aligned_poses.npy, a memory-mappable structured array',
+    )
+    parser.add_argument('--npy-dtype', choices=['float64', 'float32'], default='float64', help='precision of the pose columns in aligned_poses.npy')
+    args = parser.parse_args()
+
     np.set_printoptions(formatter={'float_kind':"{:+.3f}".format})
 
-    with open(sys.argv[2], 'r') as json_file:
+    with open(args.alignment_file, 'r') as json_file:
         alignment_info = json.load(json_file)
         alignment_info['corrective_matrix'] = np.array(alignment_info['corrective_matrix'])
 
     apply_alignment(
-        recording_path = Path(sys.argv[1]),
+        recording_path = args.recording_path,
         scale = alignment_info['scale'],
         corrective_matrix = alignment_info['corrective_matrix'],
+        chunk_size = args.chunk_size,
+        formats = args.formats,
+        npy_dtype = np.dtype(args.npy_dtype),
     )
@@ -0,0 +1,125 @@
+import argparse
+import contextlib
+import glob
+import io
+import json
+import time
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+
+from .apply_alignment import (
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_FORMATS,
+    apply_alignment,
+)
+from .pose_files import POSE_FILE_NAMES, find_pose_file
+
+
+def find_recordings(locations):
+    """
+        Every folder containing a pose file, at or below the given folders or glob patterns
+    """
+    recordings = set()
+    for location in locations:
+        for match in glob.glob(str(location), recursive=True):
+            match = Path(match)
+            if match.is_file():
+                match = match.parent
+
+            for pose_file_name in POSE_FILE_NAMES:
+                recordings.update(pose_file.parent for pose_file in match.rglob(pose_file_name))
+
+    return sorted(recordings)
+
+
+def is_current(recording_path, alignment_file, formats):
+    """
+        Whether every output is newer than both the poses and the alignment
+    """
+    output_files = [recording_path / f'aligned_poses.{output_format}' for output_format in formats]
+    if not all(output_file.exists() for output_file in output_files):
+        return False
+
+    input_time = max(find_pose_file(recording_path).stat().st_mtime, alignment_file.stat().st_mtime)
+    return min(output_file.stat().st_mtime for output_file in output_files) >= input_time
+
+
+def align_recording(recording_path, scale, corrective_matrix, chunk_size, formats):
+    start = time.perf_counter()
+
+    # output from many processes at once would be interleaved, the summary reports instead
+    with contextlib.redirect_stdout(io.StringIO()):
+        apply_alignment(recording_path, scale, corrective_matrix, chunk_size, formats)
+
+    return time.perf_counter() - start
+
+
+def batch_align(alignment_file, locations, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, formats=DEFAULT_FORMATS, force=False):
+    with open(alignment_file, 'r') as json_file:
+        alignment_info = json.load(json_file)
+        corrective_matrix = np.array(alignment_info['corrective_matrix'])
+
+    recordings = find_recordings(locations)
+    print('Found', len(recordings), 'recordings')
+
+    results = {}
+    pending = []
+    for recording_path in recordings:
+        if not force and is_current(recording_path, alignment_file, formats):
+            results[recording_path] = ('current', 0.0)
+        else:
+            pending.append(recording_path)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(align_recording, recording_path, alignment_info['scale'], corrective_matrix, chunk_size, formats): recording_path
+            for recording_path in pending
+        }
+
+        for future in as_completed(futures):
+            recording_path = futures[future]
+            try:
+                results[recording_path] = ('aligned', future.result())
+            except Exception as error:
+                results[recording_path] = (f'failed: {error}', 0.0)
+
+            print(f'[{len(results)}/{len(recordings)}] {recording_path}: {results[recording_path][0]}')
+
+    total_time = time.perf_counter() - start
+
+    name_width = max([len(str(recording_path)) for recording_path in recordings] + [9])
+    print()
+    print(f'{"recording":<{name_width}}  {"seconds":>8}  status')
+    for recording_path in recordings:
+        status, seconds = results[recording_path]
+        print(f'{str(recording_path):<{name_width}}  {seconds:8.2f}  {status}')
+
+    aligned_count = sum(status == 'aligned' for status, _ in results.values())
+    skipped_count = sum(status == 'current' for status, _ in results.values())
+    print(f'{aligned_count} aligned, {skipped_count} already current, {len(results) - aligned_count - skipped_count} failed in {total_time:.2f} s')
+
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('alignment_file', type=Path)
+    parser.add_argument('locations', nargs='+', help='folders or glob patterns which contain recordings')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes, defaults to the number of CPUs')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='number of poses transformed at a time')
+    parser.add_argument('--formats', nargs='+', choices=['csv', 'npy'], default=DEFAULT_FORMATS)
+    parser.add_argument('--force', action='store_true', help='also align recordings whose output is newer than their input')
+    args = parser.parse_args()
+
+    batch_align(
+        alignment_file = args.alignment_file,
+        locations = args.locations,
+        workers = args.workers,
+        chunk_size = args.chunk_size,
+        formats = args.formats,
+        force = args.force,
+    )
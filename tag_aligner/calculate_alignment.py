@@ -1,6 +1,14 @@
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import groupby
 from pathlib import Path
+import argparse
 import json
-import pickle
+import queue
+import sys
+import threading
+import time
 
 from tqdm import tqdm
 
@@ -12,129 +20,583 @@ from scipy.spatial.transform import Rotation
 
 import decord
 
+from .decoders import DECODER_PARAMS, DECODER_BACKENDS, decoder_cache_params, open_video
+from .pose_files import load_poses
+from .tag_detections import (
+    CACHE_FILE_NAME,
+    DETECTOR_PARAMS,
+    cache_key,
+    detections_from_tags,
+    empty_detections,
+    load_cache,
+    merge_detections,
+    save_cache,
+    select_frames,
+    subpixel_corners,
+    video_hash,
+)
 from .maths import (
+    calc_correction,
+    find_farthest_pair,
     point_distance,
+    ransac_similarity,
     rodrigues_to_rotation,
-    Transformation
+    Transformation,
+    TransformationBatch,
 )
 
-def calc_correction(bad, good):
-    good_inv = np.linalg.inv(good.to_matrix())
-    return bad.to_matrix() @ good_inv
+PNP_MODES = ["per-tag", "joint"]
 
+# Decoded frames waiting for a detector
+DECODE_QUEUE_SIZE = 8
 
-def calculate_alignment(recording_path, reference_tags):
-    scan_video = list(recording_path.glob("*.mp4"))[0]
-    pose_df = pickle.load(open(recording_path / "poses.p", "br"))
+# Frames being detected or waiting to be collected, per detector thread
+DETECT_QUEUE_SIZE = 2
 
-    scene_camera = json.load(open(recording_path / "scene_camera.json", "r"))
-    camera_distortion = np.array(scene_camera["distortion_coefficients"]).ravel()
-    camera_matrix = np.matrix(scene_camera["camera_matrix"])
 
-    at_detector = Detector()
-    pose_pairs = []
-    pose_idx = 0
+def find_posed_frames(frame_times, pose_df):
+    """
+        Returns the indices of the frames which fall inside of a pose interval
+        and the index of that pose for each of them
+    """
+    start_timestamps = np.asarray(pose_df["start_timestamp"])
+    end_timestamps = np.asarray(pose_df["end_timestamp"])
 
-    video_reader = decord.VideoReader(str(scan_video), ctx=decord.cpu(0))
-    for frame_idx,frame in enumerate(tqdm(video_reader)):
-        frame_time = video_reader.get_frame_timestamp(frame_idx)[0]
-        frame = frame.asnumpy()
+    # first pose which hasn't ended before the frame
+    pose_indices = np.searchsorted(end_timestamps, frame_times, side="left")
+    pose_indices = np.minimum(pose_indices, len(pose_df)-1)
 
-        frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    posed = (start_timestamps[pose_indices] <= frame_times) & (frame_times <= end_timestamps[pose_indices])
 
-        while pose_idx < len(pose_df)-1 and pose_df[pose_idx]["end_timestamp"] < frame_time:
-            pose_idx += 1
+    return np.flatnonzero(posed), pose_indices[posed]
 
-        if frame_time < pose_df[pose_idx]["start_timestamp"]:
-            # there"s a gap in the poses, so we must wait for the video to catch up to the poses
-            continue
-        elif frame_time > pose_df[pose_idx]["end_timestamp"]:
-            # we ran out of poses, no need to continue looking
-            break
 
-        detected_tags = at_detector.detect(frame_gray)
-        if len(detected_tags) == 0:
+# Detectors are kept per process and settings, and reused by every detect_tags call.
+# pupil_apriltags now and then crashes when a detector is destroyed.
+_detectors = {}
+
+
+def get_detectors(detector_params, count=1):
+    """
+        count detectors with the same settings. A detector must not be used by
+        several threads at once.
+    """
+    detectors = _detectors.setdefault(json.dumps(detector_params, sort_keys=True), [])
+    while len(detectors) < count:
+        detectors.append(Detector(**detector_params))
+
+    return detectors[:count]
+
+
+def print_stage_times(stage_times, detect_threads, wall_time):
+    """
+        Busy time per stage. Detection is spread over detect_threads, so the stage
+        with the largest busy time per thread limits the throughput.
+    """
+    per_thread = {
+        "decode": stage_times["decode"],
+        "detect": stage_times["detect"] / detect_threads,
+        "collect": stage_times["collect"],
+    }
+    print(
+        f"Stage times: decode {stage_times['decode']:.2f} s, "
+        f"detect {stage_times['detect']:.2f} s over {detect_threads} threads, "
+        f"collect {stage_times['collect']:.2f} s, wall {wall_time:.2f} s. "
+        f"Bottleneck: {max(per_thread, key=per_thread.get)}"
+    )
+
+
+def detect_tags(
+    scan_video,
+    frame_indices,
+    frame_times,
+    detector_params,
+    refine_corners=False,
+    decoder_params=DECODER_PARAMS,
+    detect_threads=1,
+    show_progress=True,
+):
+    """
+        Decodes the frames in one thread and detects tags in detect_threads others.
+        The detections are collected in frame order. Bounded queues between the
+        stages keep the number of frames in memory fixed.
+    """
+    detections = [empty_detections()]
+    stage_times = {"decode": 0.0, "detect": 0.0, "collect": 0.0}
+    start_time = time.perf_counter()
+
+    free_detectors = queue.Queue()
+    for at_detector in get_detectors(detector_params, detect_threads):
+        free_detectors.put(at_detector)
+
+    video = open_video(scan_video, **decoder_params)
+    decoded_frames = queue.Queue(maxsize=DECODE_QUEUE_SIZE)
+    stop_event = threading.Event()
+    decode_error = None
+
+    def decode():
+        nonlocal decode_error
+        try:
+            start = time.perf_counter()
+            for (frame_idx, frame_gray), frame_time in zip(video.read_gray(frame_indices, frame_times), frame_times):
+                stage_times["decode"] += time.perf_counter() - start
+                if stop_event.is_set():
+                    break
+
+                decoded_frames.put((int(frame_idx), frame_time, frame_gray))
+                start = time.perf_counter()
+
+        except Exception as error:
+            decode_error = error
+
+        decoded_frames.put(None)
+
+    def detect(frame_idx, frame_time, frame_gray):
+        at_detector = free_detectors.get()
+        start = time.perf_counter()
+        try:
+            detected_tags = at_detector.detect(frame_gray)
+        finally:
+            free_detectors.put(at_detector)
+
+        return frame_idx, frame_time, frame_gray, detected_tags, time.perf_counter() - start
+
+    def collect(frame_idx, frame_time, frame_gray, detected_tags, detect_time):
+        start = time.perf_counter()
+        stage_times["detect"] += detect_time
+
+        frame_detections = detections_from_tags(frame_idx, frame_time, detected_tags)
+
+        if refine_corners:
+            for corners in frame_detections["corners"]:
+                corners[:] = subpixel_corners(frame_gray, corners)
+
+        if video.downscaled:
+            frame_detections["corners"] = video.to_full_resolution(frame_detections["corners"])
+
+        detections.append(frame_detections)
+        progress.update()
+        stage_times["collect"] += time.perf_counter() - start
+
+    progress = tqdm(total=len(frame_indices), disable=not show_progress)
+    decode_thread = threading.Thread(target=decode, name="decode", daemon=True)
+    decode_thread.start()
+
+    try:
+        with ThreadPoolExecutor(max_workers=detect_threads, thread_name_prefix="detect") as executor:
+            pending = deque()
+            while True:
+                decoded = decoded_frames.get()
+                if decoded is None:
+                    break
+
+                pending.append(executor.submit(detect, *decoded))
+                if len(pending) >= detect_threads * DETECT_QUEUE_SIZE:
+                    collect(*pending.popleft().result())
+
+            while pending:
+                collect(*pending.popleft().result())
+
+    finally:
+        # lets the decoder finish if detection failed
+        stop_event.set()
+        while decode_thread.is_alive():
+            try:
+                decoded_frames.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+        progress.close()
+        video.close()
+
+    if decode_error is not None:
+        raise decode_error
+
+    if show_progress:
+        print_stage_times(stage_times, detect_threads, time.perf_counter() - start_time)
+
+    return merge_detections(detections)
+
+
+def _detect_tags_in_range(args):
+    return detect_tags(*args, show_progress=False)
+
+
+def detect_tags_parallel(
+    scan_video,
+    frame_indices,
+    frame_times,
+    detector_params,
+    refine_corners=False,
+    decoder_params=DECODER_PARAMS,
+    detect_threads=1,
+    workers=1,
+    executor=None,
+):
+    """
+        Splits the frames into ranges for a pool of worker processes. An executor
+        from detection_pool can be passed in to reuse its workers across calls.
+    """
+    if workers <= 1:
+        return detect_tags(scan_video, frame_indices, frame_times, detector_params, refine_corners, decoder_params, detect_threads)
+
+    # Several contiguous ranges per worker keep the pool busy when some
+    # ranges contain more tags than others
+    range_count = min(workers * 4, max(len(frame_indices), 1))
+    jobs = [
+        (scan_video, range_frame_indices, range_frame_times, detector_params, refine_corners, decoder_params, detect_threads)
+        for range_frame_indices, range_frame_times in zip(
+            np.array_split(frame_indices, range_count),
+            np.array_split(frame_times, range_count),
+        )
+    ]
+
+    with detection_pool(workers) if executor is None else nullcontext(executor) as pool:
+        results = list(tqdm(pool.map(_detect_tags_in_range, jobs), total=len(jobs)))
+
+    return merge_detections(results)
+
+
+def detection_pool(workers):
+    """
+        The worker processes for detect_tags_parallel, or a no-op context without
+        workers to spare
+    """
+    return ProcessPoolExecutor(max_workers=workers) if workers > 1 else nullcontext()
+
+
+def open_detection_cache(scan_video, detector_params, refine_corners=False, decoder_params=DECODER_PARAMS, cache_path=None):
+    """
+        Returns the hash info and key to save the cache under, along with the
+        detections cached with them. Without a cache_path, or if the video or any
+        setting changed, the detections are empty.
+    """
+    if cache_path is None:
+        return None, None, empty_detections()
+
+    cache = load_cache(cache_path)
+    hash_info = video_hash(scan_video, None if cache is None else cache[0])
+    key = cache_key(hash_info["digest"], detector_params, refine_corners, decoder_cache_params(decoder_params))
+
+    if cache is not None and cache[1] == key:
+        return hash_info, key, cache[2]
+
+    return hash_info, key, empty_detections()
+
+
+def detect_missing_frames(
+    detections,
+    scan_video,
+    frame_indices,
+    frame_times,
+    detector_params,
+    refine_corners=False,
+    decoder_params=DECODER_PARAMS,
+    detect_threads=1,
+    workers=1,
+    executor=None,
+):
+    """
+        Adds the detections of those frame_indices which haven't been processed yet
+    """
+    missing_mask = ~np.isin(frame_indices, detections["processed_frames"])
+    if not np.any(missing_mask):
+        return detections
+
+    print("Detecting tags in", np.count_nonzero(missing_mask), "of", len(frame_indices), "frames")
+    new_detections = detect_tags_parallel(
+        scan_video, frame_indices[missing_mask], frame_times[missing_mask], detector_params, refine_corners, decoder_params, detect_threads, workers, executor
+    )
+
+    return merge_detections([detections, new_detections])
+
+
+def update_detection_cache(cache_path, hash_info, key, cached_detections, detections):
+    """
+        Writes the detections to the cache if frames were added since it was opened
+    """
+    if cache_path is None:
+        return
+
+    if len(detections["processed_frames"]) > len(cached_detections["processed_frames"]):
+        print("Writing", cache_path)
+        save_cache(cache_path, hash_info, key, detections)
+
+    else:
+        print("Using cached tag detections from", cache_path)
+
+
+def load_detections(
+    scan_video,
+    frame_indices,
+    frame_times,
+    detector_params,
+    refine_corners=False,
+    decoder_params=DECODER_PARAMS,
+    detect_threads=1,
+    workers=1,
+    cache_path=None,
+):
+    """
+        Detects tags in the given frames. With a cache_path, detections of frames
+        which have been processed before with the same video and detector settings
+        are read from the cache and only the remaining frames are decoded. With
+        refine_corners, the detected corners are refined with cv2.cornerSubPix.
+        Decoder settings which change the decoded frames are part of the cache key.
+    """
+    hash_info, key, cached_detections = open_detection_cache(scan_video, detector_params, refine_corners, decoder_params, cache_path)
+    detections = detect_missing_frames(
+        cached_detections, scan_video, frame_indices, frame_times, detector_params, refine_corners, decoder_params, detect_threads, workers
+    )
+    update_detection_cache(cache_path, hash_info, key, cached_detections, detections)
+
+    return select_frames(detections, frame_indices)
+
+
+def sample_detections(
+    detect,
+    frame_indices,
+    pose_indices,
+    pose_df,
+    reference_tags,
+    stride,
+    max_rotation=10.0,
+    max_translation=None,
+):
+    """
+        Detects tags in every stride-th of the frame_indices first. Between two
+        sampled frames, the one halfway is then sampled too if either of them shows
+        a reference tag, or if the RIM pose turned by more than max_rotation degrees
+        or moved by more than max_translation (in pose units) from one to the other.
+        This repeats until no interval needs to be split, so the frames around tags
+        are all sampled, while stretches without tags are skipped once the probes
+        on both ends came up empty.
+
+        detect is called with the positions in frame_indices to sample, and
+        returns their detections.
+    """
+    frame_count = len(frame_indices)
+    if frame_count == 0:
+        return empty_detections()
+
+    rotvecs = np.stack([pose_df["rotation_x"], pose_df["rotation_y"], pose_df["rotation_z"]], axis=-1)
+    rotations = Rotation.from_rotvec(rotvecs[pose_indices])
+    if max_translation is not None:
+        translations = np.stack([pose_df["translation_x"], pose_df["translation_y"], pose_df["translation_z"]], axis=-1)[pose_indices]
+
+    reference_ids = np.array(list(reference_tags), dtype=np.int32)
+    sampled = np.zeros(frame_count, dtype=bool)
+    has_tag = np.zeros(frame_count, dtype=bool)
+
+    detections = []
+    positions = np.unique(np.append(np.arange(0, frame_count, stride), frame_count - 1))
+    while len(positions):
+        new_detections = detect(positions)
+        detections.append(new_detections)
+
+        sampled[positions] = True
+        tagged_frames = new_detections["frame_idx"][np.isin(new_detections["tag_id"], reference_ids)]
+        has_tag[positions[np.isin(frame_indices[positions], tagged_frames)]] = True
+
+        sampled_positions = np.flatnonzero(sampled)
+        starts, ends = sampled_positions[:-1], sampled_positions[1:]
+
+        split = has_tag[starts] | has_tag[ends]
+        split |= np.degrees((rotations[starts].inv() * rotations[ends]).magnitude()) > max_rotation
+        if max_translation is not None:
+            split |= np.linalg.norm(translations[ends] - translations[starts], axis=-1) > max_translation
+
+        split &= ends - starts > 1
+        positions = (starts[split] + ends[split]) // 2
+
+    print("Sampled", np.count_nonzero(sampled), "of", frame_count, "frames")
+
+    return merge_detections(detections)
+
+
+def pose_to_transformation(pose):
+    return Transformation(
+        np.array([pose["translation_x"], pose["translation_y"], pose["translation_z"]]),
+        rodrigues_to_rotation(np.array([pose["rotation_x"], pose["rotation_y"], pose["rotation_z"]]))
+    )
+
+
+def tag_points_3d(size):
+    return np.array([
+        [-size/2,  size/2, 0], # BL
+        [ size/2,  size/2, 0], # BR
+        [ size/2, -size/2, 0], # TL
+        [-size/2, -size/2, 0], # TR
+    ])
+
+
+def find_pose_pairs(detections, frame_pose_indices, pose_df, reference_tags, camera_matrix, camera_distortion):
+    pose_pairs = []
+    cam_pose = cam_pose_frame_idx = None
+
+    for frame_idx, tag_id, corners in zip(
+        detections["frame_idx"].tolist(),
+        detections["tag_id"].tolist(),
+        detections["corners"],
+    ):
+        if tag_id not in reference_tags:
             continue
 
-        cam_pose = Transformation(
-            np.array([
-                pose_df[pose_idx]["translation_x"],
-                pose_df[pose_idx]["translation_y"],
-                pose_df[pose_idx]["translation_z"],
-            ]),
-            rodrigues_to_rotation(np.array([
-                pose_df[pose_idx]["rotation_x"],
-                pose_df[pose_idx]["rotation_y"],
-                pose_df[pose_idx]["rotation_z"],
-            ]))
+        pose_idx = frame_pose_indices[frame_idx]
+        if cam_pose_frame_idx != frame_idx:
+            cam_pose = pose_to_transformation(pose_df[pose_idx])
+            cam_pose_frame_idx = frame_idx
+
+        ref_tag = reference_tags[tag_id]
+
+        # SOLVEPNP_IPPE_SQUARE returns 2 solutions for rotation/position/error.
+        # First one always has smallest error
+        ok, (tag_rotation,_), (tag_position,_), (error,_) = cv2.solvePnPGeneric(
+            tag_points_3d(ref_tag["size"]),
+            corners,
+            camera_matrix,
+            camera_distortion,
+            flags = cv2.SOLVEPNP_IPPE_SQUARE
         )
 
-        for detected_tag in detected_tags:
-            if detected_tag.tag_id not in reference_tags:
-                continue
-
-            ref_tag = reference_tags[detected_tag.tag_id]
-            tag_points_3d = np.array([
-                [-ref_tag["size"]/2,  ref_tag["size"]/2, 0], # BL
-                [ ref_tag["size"]/2,  ref_tag["size"]/2, 0], # BR
-                [ ref_tag["size"]/2, -ref_tag["size"]/2, 0], # TL
-                [-ref_tag["size"]/2, -ref_tag["size"]/2, 0], # TR
-            ])
-
-            # SOLVEPNP_IPPE_SQUARE returns 2 solutions for rotation/position/error.
-            # First one always has smallest error
-            ok, (tag_rotation,_), (tag_position,_), (error,_) = cv2.solvePnPGeneric(
-                tag_points_3d,
-                detected_tag.corners,
+        if not ok:
+            continue
+
+        tag_pose = Transformation(tag_position, rodrigues_to_rotation(tag_rotation))
+        cam_pose_relative_to_tag = Transformation().relative_to(tag_pose)
+        correction = calc_correction(Transformation(), ref_tag["pose"])
+        cam_pose_real = cam_pose_relative_to_tag.apply(correction)
+
+        # save pose pair info
+        pose_pairs.append({
+            "frame_idx": frame_idx,
+            "pose_idx": pose_idx,
+            "cam_pose": cam_pose,
+            "tag_pose": tag_pose,
+            "tag_pose_err": error,
+            "cam_pose_real": cam_pose_real
+        })
+
+    return pose_pairs
+
+
+def reprojection_error(world_points, image_points, world_pose, camera_matrix, camera_distortion):
+    """
+        RMS distance in pixels between image_points and the projection of
+        world_points, the same measure solvePnPGeneric reports
+    """
+    projected, _ = cv2.projectPoints(
+        world_points,
+        world_pose.rotation.as_rotvec(),
+        world_pose.position,
+        camera_matrix,
+        camera_distortion,
+    )
+
+    return np.sqrt(np.mean((projected.reshape(-1, 2) - image_points)**2))
+
+
+def find_pose_pairs_joint(detections, frame_pose_indices, pose_df, reference_tags, camera_matrix, camera_distortion):
+    """
+        Like find_pose_pairs, but solves one camera pose per frame from the corners
+        of all reference tags visible in it, placed at their known positions. Each
+        tag's IPPE solution, moved to world space, is a candidate starting point.
+        The one that best explains all corners is refined with Levenberg-Marquardt.
+
+        The pose pairs' tag_pose is the pose of the world origin in camera space,
+        and tag_pose_err is the RMS reprojection error over all corners.
+    """
+    pose_pairs = []
+    single_tag_errors = []
+    joint_errors = []
+
+    frame_rows = groupby(
+        zip(detections["frame_idx"].tolist(), detections["tag_id"].tolist(), detections["corners"]),
+        key=lambda row: row[0],
+    )
+    for frame_idx, rows in frame_rows:
+        frame_tags = [(tag_id, corners) for _, tag_id, corners in rows if tag_id in reference_tags]
+        if not frame_tags:
+            continue
+
+        world_points = []
+        candidates = []
+        for tag_id, corners in frame_tags:
+            ref_tag = reference_tags[tag_id]
+            points = tag_points_3d(ref_tag["size"])
+            world_points.append(ref_tag["pose"].rotation.apply(points) + ref_tag["pose"].position)
+
+            ok, (tag_rotation,_), (tag_position,_), _ = cv2.solvePnPGeneric(
+                points,
+                corners,
                 camera_matrix,
                 camera_distortion,
                 flags = cv2.SOLVEPNP_IPPE_SQUARE
             )
+            if ok:
+                tag_pose = Transformation(tag_position, rodrigues_to_rotation(tag_rotation))
+                candidates.append(Transformation.from_matrix(tag_pose.to_matrix() @ np.linalg.inv(ref_tag["pose"].to_matrix())))
+
+        if not candidates:
+            continue
+
+        world_points = np.concatenate(world_points)
+        image_points = np.concatenate([corners for _, corners in frame_tags])
+
+        candidate_errors = [
+            reprojection_error(world_points, image_points, candidate, camera_matrix, camera_distortion)
+            for candidate in candidates
+        ]
+        initial_pose = candidates[int(np.argmin(candidate_errors))]
+
+        world_rotation, world_position = cv2.solvePnPRefineLM(
+            world_points,
+            image_points,
+            camera_matrix,
+            camera_distortion,
+            initial_pose.rotation.as_rotvec().reshape(3, 1),
+            initial_pose.position.reshape(3, 1).copy(),
+        )
+        world_pose = Transformation(world_position, rodrigues_to_rotation(world_rotation))
+        error = reprojection_error(world_points, image_points, world_pose, camera_matrix, camera_distortion)
+
+        if len(frame_tags) > 1:
+            single_tag_errors.append(min(candidate_errors))
+            joint_errors.append(error)
 
-            if not ok:
-                continue
+        pose_idx = frame_pose_indices[frame_idx]
+        pose_pairs.append({
+            "frame_idx": frame_idx,
+            "pose_idx": pose_idx,
+            "cam_pose": pose_to_transformation(pose_df[pose_idx]),
+            "tag_pose": world_pose,
+            "tag_pose_err": error,
+            "tag_count": len(frame_tags),
+            "cam_pose_real": Transformation().relative_to(world_pose),
+        })
 
-            tag_pose = Transformation(tag_position, rodrigues_to_rotation(tag_rotation))
-            cam_pose_relative_to_tag = Transformation().relative_to(tag_pose)
-            correction = calc_correction(Transformation(), ref_tag["pose"])
-            cam_pose_real = cam_pose_relative_to_tag.apply(correction)
+    if joint_errors:
+        print(f"{len(joint_errors)} frames show several reference tags. RMS reprojection error over all of their corners (px):")
+        print(f"  best single tag pose: median={np.median(single_tag_errors):.3f}, mean={np.mean(single_tag_errors):.3f}")
+        print(f"  joint pose:           median={np.median(joint_errors):.3f}, mean={np.mean(joint_errors):.3f}")
 
-            # save pose pair info
-            pose_pairs.append({
-                "frame_idx": frame_idx,
-                "pose_idx": pose_idx,
-                "cam_pose": cam_pose,
-                "tag_pose": tag_pose,
-                "tag_pose_err": error,
-                "cam_pose_real": cam_pose_real
-            })
+    return pose_pairs
 
-    print("Found", len(pose_pairs), "pose pairs")
 
+def solve_farthest_pair(pose_pairs):
     print("Calculating scale...")
     # Find pair of points with largest difference
     # Use that to calculate scale factor
-    id_a = id_b = None
-    max_distance_virt = 0
-    for pair_idx_a, pair_a in enumerate(pose_pairs):
-        for pair_idx_b in range(pair_idx_a+1, len(pose_pairs)):
-            pair_b = pose_pairs[pair_idx_b]
-
-            distance = point_distance(pair_a["cam_pose"].position, pair_b["cam_pose"].position)
-            if distance > max_distance_virt:
-                max_distance_virt = distance
-                id_a = pair_idx_a
-                id_b = pair_idx_b
+    id_a, id_b = find_farthest_pair(np.array([pair["cam_pose"].position for pair in pose_pairs]))
 
     if id_a is not None:
         # Find scale
-        cam_pose = Transformation()
-
         cam_pose_a = pose_pairs[id_a]["cam_pose_real"]
         cam_pose_b = pose_pairs[id_b]["cam_pose_real"]
         a_pose_idx = pose_pairs[id_a]["pose_idx"]
         b_pose_idx = pose_pairs[id_b]["pose_idx"]
 
+        max_distance_virt = point_distance(pose_pairs[id_a]["cam_pose"].position, pose_pairs[id_b]["cam_pose"].position)
         max_distance_real = point_distance(cam_pose_a.position, cam_pose_b.position)
         virt_to_real_scale = max_distance_real / max_distance_virt
         print("Max distance", a_pose_idx, "to", b_pose_idx, f"virt = {max_distance_virt:0.3f}, real={max_distance_real:.03f}. Scale = {virt_to_real_scale}")
@@ -160,13 +622,200 @@ def calculate_alignment(recording_path, reference_tags):
         }
 
 
+
+def solve_ransac(pose_pairs, threshold, iterations):
+    print("Fitting similarity transform to all pose pairs...")
+    cam_poses = TransformationBatch.from_transformations([pair["cam_pose"] for pair in pose_pairs])
+    cam_poses_real = TransformationBatch.from_transformations([pair["cam_pose_real"] for pair in pose_pairs])
+
+    fit = ransac_similarity(cam_poses.positions, cam_poses_real.positions, threshold, iterations)
+    if fit is None:
+        print(f"No similarity transform fits 3 or more of the {len(pose_pairs)} pose pairs to within {threshold}")
+        return None
+
+    inliers = fit["inliers"]
+    residuals = fit["residuals"][inliers]
+
+    # the fit only uses positions, so the orientations are an independent check
+    real_to_fit = Rotation.from_matrix(fit["rotation"]) * cam_poses[inliers].rotation
+    angle_residuals = np.degrees((cam_poses_real[inliers].rotation.inv() * real_to_fit).magnitude())
+
+    print(f"Inliers: {np.count_nonzero(inliers)} of {len(inliers)} pose pairs")
+    print(f"Position residuals: median={np.median(residuals):.4f}, rms={np.sqrt(np.mean(residuals**2)):.4f}, max={np.max(residuals):.4f}")
+    print(f"Rotation residuals (deg): median={np.median(angle_residuals):.3f}, max={np.max(angle_residuals):.3f}")
+    print(f"Scale = {fit['scale']}")
+
+    # apply_alignment scales first, then applies the inverse of the corrective matrix
+    virt_to_real = np.eye(4)
+    virt_to_real[:3, :3] = fit["rotation"]
+    virt_to_real[:3, 3] = fit["translation"]
+
+    return {
+        "scale": fit["scale"],
+        "corrective_matrix": np.linalg.inv(virt_to_real),
+    }
+
+
+def calculate_alignment(
+    recording_path,
+    reference_tags,
+    workers=1,
+    use_cache=True,
+    solver="farthest-pair",
+    ransac_threshold=0.05,
+    ransac_iterations=1000,
+    refine_corners=False,
+    pnp="per-tag",
+    sample_stride=1,
+    sample_max_rotation=10.0,
+    sample_max_translation=None,
+    decoder_params=DECODER_PARAMS,
+    detect_threads=1,
+):
+    scan_video = list(recording_path.glob("*.mp4"))[0]
+    pose_df = load_poses(recording_path)
+
+    scene_camera = json.load(open(recording_path / "scene_camera.json", "r"))
+    camera_distortion = np.array(scene_camera["distortion_coefficients"]).ravel()
+    camera_matrix = np.matrix(scene_camera["camera_matrix"])
+
+    # Only frames covered by a pose are decoded
+    video_reader = decord.VideoReader(str(scan_video), ctx=decord.cpu(0))
+    frame_times = video_reader.get_frame_timestamp(np.arange(len(video_reader)))[:, 0]
+    frame_indices, pose_indices = find_posed_frames(frame_times, pose_df)
+    del video_reader
+
+    cache_path = recording_path / CACHE_FILE_NAME if use_cache else None
+    if sample_stride > 1:
+        # The cache is read and written once, while the sampling rounds only add
+        # to the detections in memory
+        hash_info, key, cached_detections = open_detection_cache(scan_video, DETECTOR_PARAMS, refine_corners, decoder_params, cache_path)
+        all_detections = cached_detections
+
+        with detection_pool(workers) as executor:
+            def detect(positions):
+                nonlocal all_detections
+                all_detections = detect_missing_frames(
+                    all_detections,
+                    scan_video,
+                    frame_indices[positions],
+                    frame_times[frame_indices[positions]],
+                    DETECTOR_PARAMS,
+                    refine_corners,
+                    decoder_params,
+                    detect_threads,
+                    workers,
+                    executor,
+                )
+                return select_frames(all_detections, frame_indices[positions])
+
+            detections = sample_detections(
+                detect,
+                frame_indices,
+                pose_indices,
+                pose_df,
+                reference_tags,
+                sample_stride,
+                sample_max_rotation,
+                sample_max_translation,
+            )
+
+        update_detection_cache(cache_path, hash_info, key, cached_detections, all_detections)
+
+    else:
+        detections = load_detections(
+            scan_video,
+            frame_indices,
+            frame_times[frame_indices],
+            DETECTOR_PARAMS,
+            refine_corners,
+            decoder_params,
+            detect_threads,
+            workers,
+            cache_path,
+        )
+
+    frame_pose_indices = dict(zip(frame_indices.tolist(), pose_indices.tolist()))
+    start_time = time.perf_counter()
+    if pnp == "joint":
+        pose_pairs = find_pose_pairs_joint(detections, frame_pose_indices, pose_df, reference_tags, camera_matrix, camera_distortion)
+    else:
+        pose_pairs = find_pose_pairs(detections, frame_pose_indices, pose_df, reference_tags, camera_matrix, camera_distortion)
+
+    print("Found", len(pose_pairs), f"pose pairs in {time.perf_counter() - start_time:.2f} s")
+
+    if solver == "ransac":
+        return solve_ransac(pose_pairs, ransac_threshold, ransac_iterations)
+
+    return solve_farthest_pair(pose_pairs)
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {value}")
+
+    return number
+
+
+def non_negative_int(value):
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"must be at least 0, not {value}")
+
+    return number
+
+
+def positive_float(value):
+    number = float(value)
+    if not 0.0 < number < float("inf"):
+        raise argparse.ArgumentTypeError(f"must be a positive number, not {value}")
+
+    return number
+
+
 if __name__ == "__main__":
-    import sys
+    parser = argparse.ArgumentParser()
+    parser.add_argument("recording_path", type=Path)
+    parser.add_argument("reference_tags", type=Path)
+    parser.add_argument("output_file", nargs="?")
+    parser.add_argument("--workers", type=positive_int, default=1, help="number of processes detecting tags in parallel")
+    parser.add_argument("--detect-threads", type=positive_int, default=1, help="threads detecting tags in each process, while another thread decodes")
+    parser.add_argument(
+        "--solver",
+        choices=["farthest-pair", "ransac"],
+        default="farthest-pair",
+        help="farthest-pair uses the two most distant poses for scale and the best localization for the correction, "
+            "ransac fits scale, rotation and translation to all pose pairs",
+    )
+    parser.add_argument("--ransac-threshold", type=float, default=0.05, help="inlier distance, in output space units")
+    parser.add_argument("--ransac-iterations", type=int, default=1000)
+    parser.add_argument("--no-cache", action="store_true", help=f"ignore and don't write {CACHE_FILE_NAME}")
+    parser.add_argument("--refine-corners", action="store_true", help="refine the detected tag corners with cv2.cornerSubPix")
+    parser.add_argument(
+        "--pnp",
+        choices=PNP_MODES,
+        default="per-tag",
+        help="per-tag localizes the camera from each tag on its own, "
+            "joint solves one camera pose per frame from all reference tags in it",
+    )
+    parser.add_argument(
+        "--sample-stride",
+        type=positive_int,
+        default=1,
+        help="detect tags in every Nth frame first, and then only fill in the frames around reference tags or fast motion",
+    )
+    parser.add_argument("--sample-max-rotation", type=float, default=10.0, help="degrees the RIM pose may turn between two sampled frames before the frames between them are sampled too")
+    parser.add_argument("--decoder", choices=list(DECODER_BACKENDS), default=DECODER_PARAMS["backend"], help="video decoding library, pyav needs the av package")
+    parser.add_argument("--decode-scale", type=positive_float, default=DECODER_PARAMS["scale"], help="decode frames scaled by this factor for faster detection. Corners are mapped back to full resolution")
+    parser.add_argument("--decode-threads", type=non_negative_int, default=DECODER_PARAMS["threads"], help="threads per decoder, 0 lets the decoder choose")
+    parser.add_argument("--sample-max-translation", type=float, default=None, help="the same for the RIM position, in pose units. Off by default")
+    args = parser.parse_args()
 
     np.set_printoptions(formatter={"float_kind":"{:+.3f}".format})
 
     reference_tags = {}
-    with open(sys.argv[2], "r") as input_file:
+    with open(args.reference_tags, "r") as input_file:
         for tag_info in json.load(input_file):
             reference_tags[tag_info["id"]] = {
                 "size": tag_info["size"],
@@ -177,15 +826,37 @@ if __name__ == "__main__":
             }
 
     alignment_info = calculate_alignment(
-        recording_path = Path(sys.argv[1]),
-        reference_tags = reference_tags
+        recording_path = args.recording_path,
+        reference_tags = reference_tags,
+        workers = args.workers,
+        use_cache = not args.no_cache,
+        solver = args.solver,
+        ransac_threshold = args.ransac_threshold,
+        ransac_iterations = args.ransac_iterations,
+        refine_corners = args.refine_corners,
+        pnp = args.pnp,
+        sample_stride = args.sample_stride,
+        sample_max_rotation = args.sample_max_rotation,
+        sample_max_translation = args.sample_max_translation,
+        detect_threads = args.detect_threads,
+        decoder_params = {
+            "backend": args.decoder,
+            "scale": args.decode_scale,
+            "threads": args.decode_threads,
+        },
     )
+
+    if alignment_info is None:
+        if args.solver == "ransac":
+            sys.exit(f"No alignment found. Try a --ransac-threshold larger than {args.ransac_threshold}")
+
+        sys.exit("No alignment found, the reference tags have to be localized from at least two different positions")
+
     alignment_info["corrective_matrix"] = alignment_info["corrective_matrix"].tolist()
 
-    if len(sys.argv) > 3:
-        output_file = sys.argv[3]
-        print("Writing", output_file)
-        with open(output_file, "w") as output_file:
+    if args.output_file is not None:
+        print("Writing", args.output_file)
+        with open(args.output_file, "w") as output_file:
             json.dump(alignment_info, output_file, indent=4)
     else:
-        json.dumps(alignment_info, indent=4)
+        print(json.dumps(alignment_info, indent=4))
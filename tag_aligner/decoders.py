@@ -0,0 +1,216 @@
+import abc
+
+import cv2
+import numpy as np
+
+import decord
+
+
+DECODE_BATCH_SIZE = 16
+
+# Jumping further ahead than this seeks to the closest keyframe instead of decoding
+# every frame in between
+SEEK_DISTANCE = 32
+
+# Detection has always used full resolution frames from decord
+DECODER_PARAMS = {
+    "backend": "decord",
+    "scale": 1.0,
+    "threads": 0,
+}
+
+# These don't change the decoded frames
+_UNKEYED_DECODER_PARAMS = ["threads"]
+
+
+def video_size(video_path):
+    cap = cv2.VideoCapture(str(video_path))
+    size = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
+
+    return size
+
+
+def iter_frames(video_reader, frame_indices, batch_size=DECODE_BATCH_SIZE):
+    for batch_start in range(0, len(frame_indices), batch_size):
+        batch_indices = frame_indices[batch_start:batch_start+batch_size]
+        frames = video_reader.get_batch([int(idx) for idx in batch_indices]).asnumpy()
+
+        yield from zip(batch_indices, frames)
+
+
+class VideoDecoder(abc.ABC):
+    """
+        Decodes grayscale frames for tag detection, optionally at a reduced size.
+        read_gray yields (frame index, frame) for the given frame indices, which
+        have to be in ascending order. frame_times are their timestamps in seconds,
+        as decord reports them.
+
+        threads is the number of decoding threads, 0 lets the backend decide.
+    """
+    def __init__(self, video_path, size=None, threads=0):
+        self.video_path = video_path
+        self.full_size = video_size(video_path)
+        self.size = self.full_size if size is None else size
+        self.threads = threads
+
+    @property
+    def downscaled(self):
+        return self.size != self.full_size
+
+    def to_full_resolution(self, points):
+        """
+            Maps pixel coordinates in the decoded frames to the full resolution video
+        """
+        factor = np.array(self.full_size, dtype=np.float64) / self.size
+        return (points + 0.5) * factor - 0.5
+
+    def resize(self, frame_gray):
+        if not self.downscaled or frame_gray.shape[::-1] == self.size:
+            return frame_gray
+
+        return cv2.resize(frame_gray, self.size, interpolation=cv2.INTER_AREA)
+
+    @abc.abstractmethod
+    def read_gray(self, frame_indices, frame_times):
+        pass
+
+    @abc.abstractmethod
+    def close(self):
+        pass
+
+
+class DecordVideo(VideoDecoder):
+    """
+        decord scales while decoding, but only produces RGB
+    """
+    def __init__(self, video_path, size=None, threads=0):
+        super().__init__(video_path, size, threads)
+
+        size_args = {"width": self.size[0], "height": self.size[1]} if self.downscaled else {}
+        self.reader = decord.VideoReader(str(video_path), ctx=decord.cpu(0), num_threads=threads, **size_args)
+
+    def read_gray(self, frame_indices, frame_times):
+        for frame_idx, frame in iter_frames(self.reader, frame_indices):
+            # The frames are RGB, but have always been converted as if they were BGR.
+            # Kept like that, so detections match those cached before.
+            yield frame_idx, cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+    def close(self):
+        del self.reader
+
+
+class PyAVVideo(VideoDecoder):
+    """
+        Takes the luma plane straight from the decoded YUV frames, without any color
+        conversion. Frames are found by their timestamps, so the file doesn't have
+        to be indexed first.
+    """
+    LUMA_FORMATS = ["yuv420p", "yuvj420p", "yuv422p", "yuvj422p", "yuv444p", "yuvj444p", "nv12", "nv21", "gray"]
+
+    def __init__(self, video_path, size=None, threads=0):
+        super().__init__(video_path, size, threads)
+
+        import av
+
+        self.container = av.open(str(video_path))
+        self.stream = self.container.streams.video[0]
+        self.stream.thread_type = "AUTO"
+        self.stream.thread_count = threads
+
+        self.frame_duration = float(1 / (self.stream.average_rate or self.stream.guessed_rate))
+
+    def to_gray(self, frame):
+        if frame.format.name not in self.LUMA_FORMATS:
+            return self.resize(frame.to_ndarray(format="gray"))
+
+        plane = frame.planes[0]
+        luma = np.frombuffer(plane, dtype=np.uint8).reshape(-1, plane.line_size)[:frame.height, :frame.width]
+
+        return np.ascontiguousarray(self.resize(luma))
+
+    def read_gray(self, frame_indices, frame_times):
+        # decord's timestamps are single precision
+        tolerance = self.frame_duration / 2
+        frames = None
+        position = None
+        for frame_idx, frame_time in zip(frame_indices, frame_times):
+            frame_idx = int(frame_idx)
+            if frames is None or frame_time <= position or frame_time - position > SEEK_DISTANCE * self.frame_duration:
+                self.container.seek(int(frame_time / self.stream.time_base), stream=self.stream, backward=True)
+                frames = self.container.decode(self.stream)
+
+            frame = None
+            for frame in frames:
+                position = frame.time
+                if position >= frame_time - tolerance:
+                    break
+
+            if frame is None or abs(position - frame_time) > tolerance:
+                raise ValueError(f"Could not decode frame {frame_idx} of {self.video_path}")
+
+            yield frame_idx, self.to_gray(frame)
+
+    def close(self):
+        self.container.close()
+
+
+class OpenCVVideo(VideoDecoder):
+    """
+        cv2.VideoCapture decodes to BGR, which is then converted to grayscale
+    """
+    def __init__(self, video_path, size=None, threads=0):
+        super().__init__(video_path, size, threads)
+
+        params = [cv2.CAP_PROP_N_THREADS, threads] if threads > 0 else []
+        self.cap = cv2.VideoCapture(str(video_path), cv2.CAP_FFMPEG, params)
+
+    def read_gray(self, frame_indices, frame_times):
+        position = -1
+        for frame_idx in frame_indices:
+            frame_idx = int(frame_idx)
+            if frame_idx <= position or frame_idx - position > SEEK_DISTANCE:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+                position = frame_idx - 1
+
+            # skipped frames still have to be decoded, but aren't converted
+            while position < frame_idx - 1:
+                self.cap.grab()
+                position += 1
+
+            status, frame = self.cap.read()
+            position += 1
+            if not status:
+                raise ValueError(f"Could not decode frame {frame_idx} of {self.video_path}")
+
+            yield frame_idx, self.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+
+    def close(self):
+        self.cap.release()
+
+
+DECODER_BACKENDS = {
+    "decord": DecordVideo,
+    "pyav": PyAVVideo,
+    "opencv": OpenCVVideo,
+}
+
+
+def open_video(video_path, backend="decord", scale=1.0, threads=0):
+    size = None
+    if scale != 1.0:
+        width, height = video_size(video_path)
+        size = max(round(width * scale), 1), max(round(height * scale), 1)
+
+    return DECODER_BACKENDS[backend](video_path, size, threads)
+
+
+def decoder_cache_params(decoder_params):
+    """
+        The decoder settings that detections have to be cached under, or None if the
+        frames are the same as with the default settings
+    """
+    keyed_params = {k: v for k, v in decoder_params.items() if k not in _UNKEYED_DECODER_PARAMS}
+    default_params = {k: v for k, v in DECODER_PARAMS.items() if k not in _UNKEYED_DECODER_PARAMS}
+
+    return None if keyed_params == default_params else keyed_params
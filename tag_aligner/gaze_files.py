@@ -0,0 +1,87 @@
+import csv
+
+import numpy as np
+
+
+# Numeric columns of a Pupil Cloud gaze.csv. The ID columns are left out.
+GAZE_FIELDS = [
+    'timestamp [ns]',
+    'gaze x [px]', 'gaze y [px]',
+    'worn',
+    'azimuth [deg]', 'elevation [deg]',
+]
+
+# Written next to gaze.csv on first load, so later loads skip parsing the CSV
+GAZE_SIDECAR_FILE_NAME = 'gaze.npy'
+
+
+def gaze_dtype(fields):
+    # 'timestamp' is added on load, in seconds since the start of the recording
+    return np.dtype(
+        [(field, np.int64 if field == 'timestamp [ns]' else np.float64) for field in fields]
+        + [('timestamp', np.float64)]
+    )
+
+
+def read_gaze_csv(csv_path):
+    with csv_path.open('r') as csv_file:
+        header = next(csv.reader([csv_file.readline()]))
+        fields = [field for field in GAZE_FIELDS if field in header]
+        dtype = gaze_dtype(fields)
+
+        columns = np.loadtxt(
+            csv_file,
+            delimiter=',',
+            usecols=[header.index(field) for field in fields],
+            dtype=np.dtype([(field, dtype[field]) for field in fields]),
+            ndmin=1,
+        )
+
+    gazes = np.empty(len(columns), dtype=dtype)
+    for field in fields:
+        gazes[field] = columns[field]
+
+    return gazes
+
+
+def sidecar_is_current(csv_path, sidecar_path):
+    return sidecar_path.exists() and sidecar_path.stat().st_mtime >= csv_path.stat().st_mtime
+
+
+def save_gaze_sidecar(sidecar_path, gazes):
+    # written next to the target and renamed, so an interrupted run can't leave half a file
+    temp_path = sidecar_path.with_name(sidecar_path.name + '.tmp')
+    with temp_path.open('wb') as sidecar_file:
+        np.save(sidecar_file, gazes)
+
+    temp_path.replace(sidecar_path)
+
+
+def load_gazes(recording_path, start_time):
+    """
+        Returns the gaze samples as a structured array with one field per numeric
+        column of gaze.csv, plus 'timestamp' in seconds relative to start_time (in ns).
+
+        The parsed columns are cached in gaze.npy, which is used as long as it is
+        newer than gaze.csv.
+    """
+    csv_path = recording_path / 'gaze.csv'
+    sidecar_path = recording_path / GAZE_SIDECAR_FILE_NAME
+
+    gazes = None
+    if sidecar_is_current(csv_path, sidecar_path):
+        try:
+            gazes = np.load(sidecar_path, allow_pickle=False)
+        except (OSError, ValueError) as error:
+            print('Ignoring unreadable gaze sidecar', sidecar_path, error)
+
+    if gazes is None:
+        gazes = read_gaze_csv(csv_path)
+        try:
+            save_gaze_sidecar(sidecar_path, gazes)
+        except OSError as error:
+            print('Could not write gaze sidecar', sidecar_path, error)
+
+    gazes['timestamp'] = (gazes['timestamp [ns]'] - start_time) / 1e9
+
+    return gazes
@@ -1,6 +1,8 @@
 import cv2
 import numpy as np
 
+from scipy.interpolate import CubicSpline
+from scipy.spatial import ConvexHull, QhullError
 from scipy.spatial.transform import Rotation
 
 class Transformation:
@@ -62,7 +64,136 @@ class Transformation:
     def apply(self, matrix):
         return Transformation.from_matrix(np.linalg.inv(matrix) @ self.to_matrix())
 
+class TransformationBatch:
+    """
+        Struct-of-arrays counterpart of Transformation for N poses
+
+        positions = (N, 3) cartesian x, y, z
+        rotations = (N, 4) quaternions x, y, z, w
+    """
+    def __init__(self, positions=None, rotations=None):
+        if positions is None and rotations is None:
+            positions = np.zeros((0, 3))
+
+        if positions is None:
+            positions = np.zeros((len(np.reshape(_as_quat(rotations), (-1, 4))), 3))
+
+        self.positions = np.array(positions, dtype=np.float64, order='C').reshape(-1, 3)
+
+        if rotations is None:
+            rotations = np.tile([0.0, 0.0, 0.0, 1.0], (len(self.positions), 1))
+
+        self.rotations = np.array(_as_quat(rotations), dtype=np.float64, order='C').reshape(-1, 4)
+
+        if len(self.positions) != len(self.rotations):
+            raise ValueError(f'{len(self.positions)} positions but {len(self.rotations)} rotations')
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return Transformation(self.positions[key], Rotation.from_quat(self.rotations[key]))
+
+        return TransformationBatch(self.positions[key], self.rotations[key])
+
+    def __repr__(self):
+        return f'TransformationBatch({len(self)} poses)'
+
+    @property
+    def rotation(self):
+        return Rotation.from_quat(self.rotations)
+
+    @staticmethod
+    def from_transformations(transformations):
+        return TransformationBatch(
+            np.array([t.position for t in transformations]).reshape(-1, 3),
+            np.array([t.rotation.as_quat() for t in transformations]).reshape(-1, 4),
+        )
+
+    def to_transformations(self):
+        return [self[idx] for idx in range(len(self))]
+
+    @staticmethod
+    def from_matrix(matrices):
+        matrices = np.reshape(matrices, (-1, 4, 4))
+        return TransformationBatch(matrices[:, :3, 3], Rotation.from_matrix(matrices[:, :3, :3]))
+
+    def to_matrix(self):
+        matrices = np.zeros((len(self), 4, 4))
+        matrices[:, :3, :3] = self.rotation.as_matrix()
+        matrices[:, :3, 3] = self.positions
+        matrices[:, 3, 3] = 1.0
+
+        return matrices
+
+    def copy(self):
+        return TransformationBatch(self.positions, self.rotations)
+
+    def inv(self):
+        inverse_rotation = self.rotation.inv()
+        return TransformationBatch(-inverse_rotation.apply(self.positions), inverse_rotation)
+
+    def compose(self, other):
+        """
+            Equivalent to self.to_matrix() @ other.to_matrix(), pose by pose.
+            Either side may be a single Transformation or a batch of length 1,
+            in which case it is broadcast over the other side.
+        """
+        this, other = _broadcast(self, _as_batch(other))
+        rotation = this.rotation
+
+        return TransformationBatch(
+            rotation.apply(other.positions) + this.positions,
+            rotation * other.rotation,
+        )
+
+    def __matmul__(self, other):
+        return self.compose(other)
+
+    def relative_to(self, reference):
+        return _as_batch(reference).inv().compose(self)
+
+    def apply(self, matrix):
+        return TransformationBatch.from_matrix(np.linalg.inv(matrix) @ self.to_matrix())
+
+
+def _as_quat(rotations):
+    if isinstance(rotations, Rotation):
+        return rotations.as_quat()
+
+    return rotations
+
+
+def _broadcast(a, b):
+    if len(a) == 1 and len(b) != 1:
+        a = TransformationBatch(np.repeat(a.positions, len(b), axis=0), np.repeat(a.rotations, len(b), axis=0))
+
+    elif len(b) == 1 and len(a) != 1:
+        b = TransformationBatch(np.repeat(b.positions, len(a), axis=0), np.repeat(b.rotations, len(a), axis=0))
+
+    elif len(a) != len(b):
+        raise ValueError(f'Cannot broadcast {len(a)} poses with {len(b)} poses')
+
+    return a, b
+
+
+def _as_batch(transform):
+    if isinstance(transform, TransformationBatch):
+        return transform
+
+    return TransformationBatch(transform.position, transform.rotation)
+
+
 def cv_space_to_qt3d_space(transform):
+    if isinstance(transform, TransformationBatch):
+        # Negating the y and z euler angles is a conjugation by a half turn about x,
+        # which negates the y and z components of the quaternion
+        return TransformationBatch(
+            transform.positions * [1.0, -1.0, -1.0],
+            transform.rotations * [1.0, -1.0, -1.0, 1.0],
+        )
+
     pos = transform.position.copy()
     pos[1] *= -1
     pos[2] *= -1
@@ -82,10 +213,311 @@ def rodrigues_to_rotation(rotation_rod):
     return Rotation.from_matrix(rotation_matrix)
 
 
+def rodrigues_to_rotations(rotations_rod):
+    # A Rodrigues vector is an axis scaled by its angle, i.e., a rotation vector
+    return Rotation.from_rotvec(np.reshape(rotations_rod, (-1, 3)))
+
+
 def point_distance(a, b):
     return np.linalg.norm(a-b)
 
 
+def _hull_vertices(points):
+    """
+        Indices of the convex hull vertices of (N, 3) points. Flat or collinear point
+        sets have no 3D hull, so they are projected onto their principal plane or
+        line first.
+    """
+    try:
+        return ConvexHull(points).vertices
+    except QhullError:
+        pass
+
+    _, _, axes = np.linalg.svd(points - np.mean(points, axis=0), full_matrices=False)
+    try:
+        return ConvexHull(points @ axes[:2].T).vertices
+    except QhullError:
+        projected = points @ axes[0]
+        return np.unique([np.argmin(projected), np.argmax(projected)])
+
+
+def find_farthest_pair(points, block_size=256):
+    """
+        Returns the indices (a, b), a < b, of the two points which are the farthest
+        apart, or (None, None) if no two points differ. Like a scan over all pairs
+        in order, ties resolve to the first pair.
+
+        The farthest pair always lies on the convex hull, so only hull vertices are
+        compared with each other. That holds for flat trajectories too, which are
+        reduced to a 2D hull.
+    """
+    points = np.reshape(points, (-1, 3))
+
+    unique_points, first_indices = np.unique(points, axis=0, return_index=True)
+    if len(unique_points) < 2:
+        return None, None
+
+    candidates = np.arange(len(unique_points))
+    if len(unique_points) > 16:
+        candidates = _hull_vertices(unique_points)
+
+    candidate_points = unique_points[candidates]
+
+    def distances_from(rows):
+        return np.linalg.norm(candidate_points[rows, np.newaxis] - candidate_points[np.newaxis], axis=-1)
+
+    distances = np.zeros(len(candidates))
+    for block_start in range(0, len(candidates), block_size):
+        block_rows = slice(block_start, block_start+block_size)
+        distances[block_rows] = np.max(distances_from(block_rows), axis=1)
+
+    max_distance = np.max(distances)
+    best = None
+    for candidate_idx in np.flatnonzero(distances == max_distance):
+        for partner_idx in np.flatnonzero(distances_from([candidate_idx])[0] == max_distance):
+            pair = sorted([
+                first_indices[candidates[candidate_idx]],
+                first_indices[candidates[partner_idx]],
+            ])
+
+            if best is None or pair < best:
+                best = pair
+
+    return int(best[0]), int(best[1])
+
+
+def umeyama(source, target):
+    """
+        Closed-form least-squares similarity transform between point sets, such that
+        target ~= scale * rotation @ source + translation
+
+        source, target = (..., N, 3), optionally batched over leading dimensions
+        Returns scale (...), rotation (..., 3, 3) and translation (..., 3)
+    """
+    source_mean = np.mean(source, axis=-2)
+    target_mean = np.mean(target, axis=-2)
+    source_centered = source - source_mean[..., np.newaxis, :]
+    target_centered = target - target_mean[..., np.newaxis, :]
+
+    covariance = np.swapaxes(target_centered, -1, -2) @ source_centered / source.shape[-2]
+    u, singular_values, vt = np.linalg.svd(covariance)
+
+    # flip the weakest axis if the best orthogonal fit is a reflection
+    signs = np.ones(singular_values.shape)
+    signs[..., 2] = np.where(np.linalg.det(u) * np.linalg.det(vt) < 0, -1.0, 1.0)
+    rotation = u @ (signs[..., :, np.newaxis] * vt)
+
+    source_variance = np.sum(source_centered**2, axis=(-1, -2)) / source.shape[-2]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scale = np.sum(singular_values * signs, axis=-1) / source_variance
+
+    translation = target_mean - scale[..., np.newaxis] * (rotation @ source_mean[..., np.newaxis])[..., 0]
+
+    return scale, rotation, translation
+
+
+def similarity_residuals(source, target, scale, rotation, translation):
+    """
+        Distances between the transformed source points and the target points.
+        With K stacked transforms, returns (K, N) residuals.
+    """
+    scale = np.asarray(scale)
+    transformed = scale[..., np.newaxis, np.newaxis] * (source @ np.swapaxes(rotation, -1, -2))
+    transformed += np.asarray(translation)[..., np.newaxis, :]
+
+    return np.linalg.norm(transformed - target, axis=-1)
+
+
+def ransac_similarity(source, target, threshold, iterations=1000, refinements=3, rng=None, block_size=64):
+    """
+        Robust similarity fit between corresponding (N, 3) point sets. Minimal samples
+        of three correspondences are solved with umeyama all at once, the hypothesis with
+        the most correspondences closer than threshold wins, and the fit is then refined
+        over its inliers.
+
+        Returns a dict with scale, rotation, translation, the inlier mask and the
+        residuals of all correspondences, or None if no hypothesis has enough inliers
+    """
+    if rng is None:
+        rng = np.random.default_rng(0)
+
+    source = np.reshape(source, (-1, 3))
+    target = np.reshape(target, (-1, 3))
+    if len(source) < 3:
+        return None
+
+    samples = rng.integers(0, len(source), size=(iterations, 3))
+    samples = samples[
+        (samples[:, 0] != samples[:, 1]) & (samples[:, 1] != samples[:, 2]) & (samples[:, 0] != samples[:, 2])
+    ]
+
+    scales, rotations, translations = umeyama(source[samples], target[samples])
+
+    best_idx = None
+    best_score = (0, 0.0)
+    for block_start in range(0, len(samples), block_size):
+        block = slice(block_start, block_start+block_size)
+        residuals = similarity_residuals(source, target, scales[block], rotations[block], translations[block])
+        inliers = residuals < threshold
+
+        inlier_counts = np.count_nonzero(inliers, axis=1)
+        inlier_errors = np.sum(np.where(inliers, residuals, 0.0), axis=1)
+        for idx in np.flatnonzero(inlier_counts == np.max(inlier_counts)):
+            # more inliers is better, smaller error among them breaks ties
+            score = (inlier_counts[idx], -inlier_errors[idx])
+            if score > best_score:
+                best_score = score
+                best_idx = block_start + idx
+
+    if best_idx is None or best_score[0] < 3:
+        return None
+
+    scale, rotation, translation = scales[best_idx], rotations[best_idx], translations[best_idx]
+    inliers = similarity_residuals(source, target, scale, rotation, translation) < threshold
+    for _ in range(refinements):
+        scale, rotation, translation = umeyama(source[inliers], target[inliers])
+        residuals = similarity_residuals(source, target, scale, rotation, translation)
+        refined_inliers = residuals < threshold
+
+        if np.count_nonzero(refined_inliers) < 3 or np.array_equal(refined_inliers, inliers):
+            break
+
+        inliers = refined_inliers
+
+    residuals = similarity_residuals(source, target, scale, rotation, translation)
+
+    return {
+        "scale": float(scale),
+        "rotation": rotation,
+        "translation": translation,
+        "inliers": residuals < threshold,
+        "residuals": residuals,
+    }
+
+
+def slerp(quaternions_a, quaternions_b, fractions):
+    """
+        Spherical linear interpolation between (N, 4) x, y, z, w quaternions, along the
+        shorter arc. fractions = (N,) with 0 giving a and 1 giving b.
+    """
+    fractions = np.asarray(fractions)[..., np.newaxis]
+    dot = np.sum(quaternions_a * quaternions_b, axis=-1, keepdims=True)
+
+    # q and -q are the same rotation, the one closer to a is the shorter way round
+    quaternions_b = np.where(dot < 0, -quaternions_b, quaternions_b)
+    dot = np.abs(dot)
+
+    angle = np.arccos(np.clip(dot, -1.0, 1.0))
+    sin_angle = np.sin(angle)
+
+    # almost identical rotations would divide by ~0, but lerp is exact enough there
+    nearly_parallel = sin_angle < 1e-6
+    safe_sin_angle = np.where(nearly_parallel, 1.0, sin_angle)
+    weights_a = np.where(nearly_parallel, 1.0 - fractions, np.sin((1.0 - fractions) * angle) / safe_sin_angle)
+    weights_b = np.where(nearly_parallel, fractions, np.sin(fractions * angle) / safe_sin_angle)
+
+    interpolated = weights_a * quaternions_a + weights_b * quaternions_b
+    return interpolated / np.linalg.norm(interpolated, axis=-1, keepdims=True)
+
+
+class PoseInterpolator:
+    """
+        Samples a trajectory at arbitrary timestamps. Rotations are interpolated with
+        SLERP, positions linearly or with a cubic spline.
+
+        sample_times = (N,) increasing, e.g. the midpoints of the pose intervals
+        positions = (N, 3)
+        rotations = (N, 4) quaternions x, y, z, w
+
+        Where the samples around a timestamp are more than max_gap seconds apart, or
+        the timestamp is outside of the samples, gap decides what happens: 'nan'
+        leaves the result invalid (NaN) and 'nearest' uses the closer sample. With
+        max_gap=None, every gap is interpolated.
+    """
+    METHODS = ['linear', 'cubic']
+    GAP_MODES = ['nan', 'nearest']
+
+    def __init__(self, sample_times, positions, rotations, method='linear', max_gap=None, gap='nan'):
+        if method not in self.METHODS:
+            raise ValueError(f'Unknown interpolation method {method}, expected one of {self.METHODS}')
+        if gap not in self.GAP_MODES:
+            raise ValueError(f'Unknown gap mode {gap}, expected one of {self.GAP_MODES}')
+
+        sample_times = np.asarray(sample_times, dtype=np.float64)
+        # repeated timestamps can't be interpolated between, the first sample is kept
+        keep = np.concatenate([[True], np.diff(sample_times) > 0]) if len(sample_times) > 0 else np.zeros(0, dtype=bool)
+
+        self.sample_times = sample_times[keep]
+        self.positions = np.asarray(positions, dtype=np.float64)[keep]
+        self.rotations = np.asarray(rotations, dtype=np.float64)[keep]
+        self.max_gap = max_gap
+        self.gap = gap
+
+        self.spline = None
+        if method == 'cubic' and len(self.sample_times) >= 3:
+            self.spline = CubicSpline(self.sample_times, self.positions, axis=0)
+
+    def __len__(self):
+        return len(self.sample_times)
+
+    def __call__(self, timestamps):
+        """
+            Returns the (M, 3) positions, (M, 4) rotations and an (M,) mask of the valid
+            results
+        """
+        timestamps = np.asarray(timestamps, dtype=np.float64).reshape(-1)
+        count = len(self.sample_times)
+
+        positions = np.full((len(timestamps), 3), np.nan)
+        rotations = np.full((len(timestamps), 4), np.nan)
+        if count == 0:
+            return positions, rotations, np.zeros(len(timestamps), dtype=bool)
+
+        after = np.searchsorted(self.sample_times, timestamps, side='right')
+        before = np.maximum(after - 1, 0)
+        after = np.minimum(after, count - 1)
+        inside = (timestamps >= self.sample_times[0]) & (timestamps <= self.sample_times[-1])
+
+        gap_size = self.sample_times[after] - self.sample_times[before]
+        interpolate = inside
+        if self.max_gap is not None:
+            interpolate = interpolate & (gap_size <= self.max_gap)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fractions = np.where(gap_size > 0, (timestamps - self.sample_times[before]) / gap_size, 0.0)
+
+        a, b, f = before[interpolate], after[interpolate], fractions[interpolate]
+        if self.spline is not None:
+            positions[interpolate] = self.spline(timestamps[interpolate])
+        else:
+            positions[interpolate] = self.positions[a] + f[:, np.newaxis] * (self.positions[b] - self.positions[a])
+        rotations[interpolate] = slerp(self.rotations[a], self.rotations[b], f)
+
+        valid = interpolate
+        if self.gap == 'nearest':
+            nearest = np.where(fractions <= 0.5, before, after)
+            nearest = np.where(timestamps < self.sample_times[0], 0, nearest)
+            nearest = np.where(timestamps > self.sample_times[-1], count - 1, nearest)
+
+            positions[~interpolate] = self.positions[nearest[~interpolate]]
+            rotations[~interpolate] = self.rotations[nearest[~interpolate]]
+            valid = np.ones(len(timestamps), dtype=bool)
+
+        return positions, rotations, valid
+
+
+def calc_correction(bad, good):
+    """
+        The matrix which takes the good pose to the bad one
+    """
+    good_inv = np.linalg.inv(good.to_matrix())
+    return bad.to_matrix() @ good_inv
+
+
+def apply_correction(transform, correction_matrix):
+    return Transformation.from_matrix(np.linalg.inv(correction_matrix) @ transform.to_matrix())
+
+
 def transform_by_reference(obj_b, obj_a, parent_a=None):
     if parent_a is None:
         parent_a = obj_a
@@ -1,5 +1,4 @@
-import csv
-import sys
+import argparse
 import json
 import struct
 from pathlib import Path
@@ -33,20 +32,29 @@ from PySide6.Qt3DExtras import Qt3DExtras
 from PySide6.Qt3DCore import Qt3DCore
 from PySide6.Qt3DRender import Qt3DRender
 
-from .maths import (
-    Transformation,
-    cv_space_to_qt3d_space
-)
+from .gaze_files import load_gazes
+from .maths import PoseInterpolator
+from .pose_files import load_aligned_poses
+from .qt_tracks import gaze_track_qt, pose_track_qt
+from .timestamp_index import TimestampIndex
 
 import numpy as np
-from scipy.spatial.transform import Rotation
+
+
+# samples further than this from the video position (in seconds) are not shown
+GAZE_OMISSION_THRESHOLD = 1/100
+POSE_OMISSION_THRESHOLD = 1/15
+
+# when interpolating, poses further apart than this (in seconds) aren't interpolated between
+INTERPOLATION_MAX_GAP = 0.5
 
 
 class PlaybackApp(QApplication):
-    def __init__(self):
+    def __init__(self, interpolate=False):
         super().__init__()
 
         self.window = PlaybackWindow()
+        self.window.scene_widget.interpolate = interpolate
         self.window.show()
 
         self.gazes = None
@@ -56,27 +64,19 @@ class PlaybackApp(QApplication):
         video_file = videos[0]
         self.window.video_widget.load(video_file)
 
-        pose_file = path / 'aligned_poses.csv'
-        self.window.scene_widget.load_poses(pose_file)
+        self.window.scene_widget.load_poses(path)
 
         with Path(path/'info.json').open('r') as recording_info_file:
             recording_info = json.load(recording_info_file)
 
-        gaze_file = path / 'gaze.csv'
-        with gaze_file.open('r') as csv_file:
-            reader = csv.DictReader(csv_file)
-            self.gazes = []
-            for row in reader:
-                for k in row:
-                    if ' id' not in k:
-                        row[k] = float(row[k])
-
-                row['timestamp'] = (row['timestamp [ns]'] - recording_info['start_time']) / 1e9
-
-                self.gazes.append(row)
+        # one structured array, shared by both widgets
+        self.gazes = load_gazes(path, recording_info['start_time'])
+        self.gaze_index = TimestampIndex(self.gazes['timestamp'])
+        print(len(self.gazes), 'gaze samples loaded')
 
-        self.window.scene_widget.set_gazes(self.gazes)
-        self.window.video_widget.set_gazes(self.gazes)
+        # sharing the index means the second widget gets the first one's lookup for free
+        self.window.scene_widget.set_gazes(self.gazes, self.gaze_index)
+        self.window.video_widget.set_gazes(self.gazes, self.gaze_index)
 
     def load_scene(self, path):
         self.window.scene_widget.load_scene(path)
@@ -152,9 +152,10 @@ class VideoPlayerWidget(QGraphicsView):
         self.player.mediaStatusChanged.connect(lambda _: QTimer.singleShot(1000, self.fit_view))
 
         self.gazes = []
+        self.gaze_index = TimestampIndex([])
 
     def _on_video_position_changed(self, timestamp_ms):
-        gaze_idx = find_gaze_index_by_timestamp(self.gazes, timestamp_ms/1000.0)
+        gaze_idx = self.gaze_index.nearest(timestamp_ms/1000.0, GAZE_OMISSION_THRESHOLD)
         if gaze_idx is None:
             self.set_gaze_point(None, None)
             return
@@ -181,8 +182,9 @@ class VideoPlayerWidget(QGraphicsView):
     def load(self, path):
         self.player.setSource(QUrl.fromLocalFile(str(path)))
 
-    def set_gazes(self, gazes):
+    def set_gazes(self, gazes, gaze_index=None):
         self.gazes = gazes
+        self.gaze_index = gaze_index if gaze_index is not None else TimestampIndex(gazes['timestamp'])
 
     def set_gaze_point(self, x, y):
         if x is None or y is None:
@@ -311,49 +313,60 @@ class ScenePlayerWidget(SceneViewerWidget):
         super().__init__()
 
         self.poses = []
+        self.pose_index = TimestampIndex([])
+        self.pose_positions_qt = np.zeros((0, 3))
+        self.pose_rotations_qt = np.zeros((0, 4))
+        self.interpolate = False
+        self.pose_interpolator = None
         self.gazes = []
+        self.gaze_index = TimestampIndex([])
+        self.gaze_rotations_qt = np.zeros((0, 4))
         self.installEventFilter(self)
 
-    def load_poses(self, path):
-        with path.open('r') as csv_file:
-            reader = csv.DictReader(csv_file)
-            self.poses = []
-            for row in reader:
-                row = {k:float(v) for k,v in row.items()}
-                self.poses.append(row)
+    def load_poses(self, recording_path):
+        # aligned_poses.npy is memory-mapped, aligned_poses.csv is the fallback
+        self.poses = load_aligned_poses(recording_path)
+        self.pose_index = TimestampIndex(self.poses['start_timestamp'], self.poses['end_timestamp'])
+
+        # converted once, so seeking is only a lookup
+        self.pose_positions_qt, self.pose_rotations_qt = pose_track_qt(self.poses)
+
+        if self.interpolate:
+            # the conversion to Qt space only flips signs, so interpolating there is the same
+            self.pose_interpolator = PoseInterpolator(
+                self.pose_index.midpoints,
+                self.pose_positions_qt,
+                self.pose_rotations_qt[:, [1, 2, 3, 0]],
+                max_gap=INTERPOLATION_MAX_GAP,
+            )
 
         print(len(self.poses), 'poses loaded')
 
-    def set_gazes(self, gazes):
+    def set_gazes(self, gazes, gaze_index=None):
         self.gazes = gazes
+        self.gaze_index = gaze_index if gaze_index is not None else TimestampIndex(gazes['timestamp'])
+        self.gaze_rotations_qt = gaze_track_qt(gazes)
 
     def seek_to_time(self, timestamp_ms):
-        pose_idx = find_pose_index_by_timestamp(self.poses, timestamp_ms/1000.0)
+        interpolated = False
+        if self.pose_interpolator is not None:
+            positions, rotations, valid = self.pose_interpolator([timestamp_ms/1000.0])
+            if valid[0]:
+                x,y,z,w = rotations[0].tolist()
+                self.scene_viewer.set_subject_pose(QVector3D(*positions[0].tolist()), QQuaternion(w,x,y,z))
+                interpolated = True
+
+        # outside of the interpolated range, the nearest pose is shown like before
+        pose_idx = None if interpolated else self.pose_index.nearest(timestamp_ms/1000.0, POSE_OMISSION_THRESHOLD)
         if pose_idx is not None:
-            pose = self.poses[pose_idx]
-
-            cam_pose_cv = Transformation(
-                np.array([pose['translation_x'], pose['translation_y'], pose['translation_z']]),
-                Rotation.from_quat([pose['rotation_x'], pose['rotation_y'], pose['rotation_z'], pose['rotation_w']]),
-            )
-            cam_pose_qt = cv_space_to_qt3d_space(cam_pose_cv)
-
-            position = QVector3D(*cam_pose_qt.position)
-            x,y,z,w = cam_pose_qt.rotation.as_quat()
-            rotation = QQuaternion(w,x,y,z)
+            position = QVector3D(*self.pose_positions_qt[pose_idx].tolist())
+            rotation = QQuaternion(*self.pose_rotations_qt[pose_idx].tolist())
 
             self.scene_viewer.set_subject_pose(position, rotation)
 
-        gaze_idx = find_gaze_index_by_timestamp(self.gazes, timestamp_ms/1000.0)
+        gaze_idx = self.gaze_index.nearest(timestamp_ms/1000.0, GAZE_OMISSION_THRESHOLD)
         if gaze_idx is not None:
-            gaze = self.gazes[gaze_idx]
-            gaze_transform_cv = Transformation(
-                np.array([0.0, 0.0, 0.0]),
-                Rotation.from_euler('xyz', [gaze['elevation [deg]'], gaze['azimuth [deg]'], 0.0], degrees=True),
-            )
-            gaze_pose_qt = cv_space_to_qt3d_space(gaze_transform_cv)
-            x,y,z,w = gaze_pose_qt.rotation.as_quat()
-            rotation = QQuaternion(w,x,y,z)
+            rotation = QQuaternion(*self.gaze_rotations_qt[gaze_idx].tolist())
             self.scene_viewer.set_gaze_angle(rotation)
         else:
             self.scene_viewer.set_gaze_angle(None)
@@ -362,48 +375,15 @@ class ScenePlayerWidget(SceneViewerWidget):
         self.scene_viewer.camera().translateWorld(QVector3D(x, y, z))
 
 
-def find_gaze_index_by_timestamp(gazes, timestamp, omission_threshold=1/100):
-    left_idx = 0
-    right_idx = len(gazes)-1
-    while right_idx - left_idx > 1:
-        mid_idx = (left_idx + right_idx) // 2
-
-        if timestamp < gazes[mid_idx]['timestamp']:
-            right_idx = mid_idx
-        elif timestamp > gazes[mid_idx]['timestamp']:
-            left_idx = mid_idx
-        else:
-            break
-
-    if abs(timestamp-gazes[mid_idx]['timestamp']) > omission_threshold:
-        return None
-
-    return mid_idx
-
-def find_pose_index_by_timestamp(poses, timestamp, omission_threshold=1/15):
-    left_idx = 0
-    right_idx = len(poses)-1
-    while right_idx - left_idx > 1:
-        mid_idx = (left_idx + right_idx) // 2
-
-        if timestamp < poses[mid_idx]['start_timestamp']:
-            right_idx = mid_idx
-        elif timestamp > poses[mid_idx]['end_timestamp']:
-            left_idx = mid_idx
-        else:
-            break
-
-    mean_ts = (poses[mid_idx]['start_timestamp']+poses[mid_idx]['end_timestamp'])/2
-    if abs(timestamp-mean_ts) > omission_threshold:
-        return None
-
-    return mid_idx
-
-
-
 if __name__ == '__main__':
-    app = PlaybackApp()
-    app.load_recording(Path(sys.argv[1]))
-    app.load_scene(Path(sys.argv[2]))
+    parser = argparse.ArgumentParser()
+    parser.add_argument('recording_path', type=Path)
+    parser.add_argument('scene_path', type=Path)
+    parser.add_argument('--interpolate', action='store_true', help='interpolate between poses instead of showing the nearest one')
+    args = parser.parse_args()
+
+    app = PlaybackApp(args.interpolate)
+    app.load_recording(args.recording_path)
+    app.load_scene(args.scene_path)
     app.play()
     app.exec()
@@ -0,0 +1,138 @@
+import csv
+import pickle
+
+import numpy as np
+
+
+POSE_FIELDS = [
+    'start_timestamp', 'end_timestamp',
+    'translation_x', 'translation_y', 'translation_z',
+    'rotation_x', 'rotation_y', 'rotation_z',
+]
+
+ALIGNED_POSE_FIELDS = [
+    'start_timestamp', 'end_timestamp',
+    'translation_x', 'translation_y', 'translation_z',
+    'rotation_x', 'rotation_y', 'rotation_z', 'rotation_w',
+]
+
+# In order of preference among equally new files. The .npy files hold a structured
+# array with one field per column, which can be memory-mapped.
+POSE_FILE_NAMES = ['poses.npy', 'poses.p']
+ALIGNED_POSE_FILE_NAMES = ['aligned_poses.npy', 'aligned_poses.csv']
+
+
+def pose_dtype(fields, column_dtype=np.float64):
+    # timestamps are always stored in double precision
+    return np.dtype([
+        (field, np.float64 if field.endswith('timestamp') else column_dtype)
+        for field in fields
+    ])
+
+
+def find_pose_file(recording_path, file_names=POSE_FILE_NAMES):
+    """
+        The most recently written of the pose files, so a format that wasn't
+        rewritten isn't used in place of newer poses. Files written at the same time
+        are picked in the order of file_names.
+    """
+    pose_paths = [recording_path / file_name for file_name in file_names if (recording_path / file_name).exists()]
+    if len(pose_paths) == 0:
+        raise FileNotFoundError(f'No pose file ({", ".join(file_names)}) in {recording_path}')
+
+    # max returns the first of equally new files
+    return max(pose_paths, key=lambda pose_path: pose_path.stat().st_mtime)
+
+
+def poses_to_arrays(pose_df):
+    return {
+        field: np.fromiter((pose[field] for pose in pose_df), dtype=np.float64, count=len(pose_df))
+        for field in POSE_FIELDS
+    }
+
+
+def columns_to_records(columns, fields, column_dtype=np.float64):
+    records = np.empty(len(columns[fields[0]]), dtype=pose_dtype(fields, column_dtype))
+    for field in fields:
+        records[field] = columns[field]
+
+    return records
+
+
+def read_csv_records(csv_path, fields):
+    with csv_path.open('r') as csv_file:
+        header = next(csv.reader([csv_file.readline()]))
+        return np.loadtxt(
+            csv_file,
+            delimiter=',',
+            usecols=[header.index(field) for field in fields],
+            dtype=pose_dtype(fields),
+            ndmin=1,
+        )
+
+
+def load_pose_records(pose_path, fields):
+    """
+        Returns the poses as a structured array, which supports the same
+        poses[idx][field] access as the list of dicts in poses.p. .npy files are
+        memory-mapped rather than read.
+    """
+    if pose_path.suffix == '.npy':
+        return np.load(pose_path, mmap_mode='r')
+
+    if pose_path.suffix == '.csv':
+        return read_csv_records(pose_path, fields)
+
+    with pose_path.open('br') as pose_file:
+        return columns_to_records(poses_to_arrays(pickle.load(pose_file)), fields)
+
+
+def load_poses(recording_path):
+    return load_pose_records(find_pose_file(recording_path), POSE_FIELDS)
+
+
+def load_aligned_poses(recording_path):
+    return load_pose_records(find_pose_file(recording_path, ALIGNED_POSE_FILE_NAMES), ALIGNED_POSE_FIELDS)
+
+
+def open_pose_chunks(pose_path, chunk_size):
+    """
+        Returns the number of poses and an iterator over dicts of pose column arrays
+        with up to chunk_size rows each.
+
+        A pickle has to be loaded completely up front, so only .npy input keeps
+        memory bounded.
+    """
+    if pose_path.suffix == '.npy':
+        records = np.load(pose_path, mmap_mode='r')
+        return len(records), _iter_record_chunks(records, chunk_size)
+
+    with pose_path.open('br') as pose_file:
+        pose_df = pickle.load(pose_file)
+
+    return len(pose_df), (
+        poses_to_arrays(pose_df[chunk_start:chunk_start+chunk_size])
+        for chunk_start in range(0, len(pose_df), chunk_size)
+    )
+
+
+def _iter_record_chunks(records, chunk_size):
+    for chunk_start in range(0, len(records), chunk_size):
+        chunk = records[chunk_start:chunk_start+chunk_size]
+        yield {field: np.asarray(chunk[field], dtype=np.float64) for field in POSE_FIELDS}
+
+
+def write_pose_npy(pose_path, pose_df):
+    np.save(pose_path, columns_to_records(poses_to_arrays(pose_df), POSE_FIELDS))
+
+
+def open_aligned_pose_npy(pose_path, count, column_dtype=np.float64):
+    """
+        Creates a memory-mapped aligned pose file for count poses, to be filled in chunks
+    """
+    return np.lib.format.open_memmap(
+        pose_path,
+        mode='w+',
+        dtype=pose_dtype(ALIGNED_POSE_FIELDS, column_dtype),
+        shape=(count,),
+    )
@@ -0,0 +1,36 @@
+import numpy as np
+from scipy.spatial.transform import Rotation
+
+from .maths import TransformationBatch, cv_space_to_qt3d_space
+
+
+# Qt stores vectors and quaternions in single precision anyway
+TRACK_DTYPE = np.float32
+
+
+def xyzw_to_wxyz(quaternions):
+    return np.ascontiguousarray(quaternions[:, [3, 0, 1, 2]], dtype=TRACK_DTYPE)
+
+
+def pose_track_qt(poses):
+    """
+        The positions and rotations (as w, x, y, z quaternions, like QQuaternion) of
+        aligned poses in Qt3D space
+    """
+    poses_cv = TransformationBatch(
+        np.stack([poses['translation_x'], poses['translation_y'], poses['translation_z']], axis=-1),
+        np.stack([poses['rotation_x'], poses['rotation_y'], poses['rotation_z'], poses['rotation_w']], axis=-1),
+    )
+    poses_qt = cv_space_to_qt3d_space(poses_cv)
+
+    return np.ascontiguousarray(poses_qt.positions, dtype=TRACK_DTYPE), xyzw_to_wxyz(poses_qt.rotations)
+
+
+def gaze_track_qt(gazes):
+    """
+        The gaze rotations in Qt3D space, as w, x, y, z quaternions
+    """
+    euler = np.stack([gazes['elevation [deg]'], gazes['azimuth [deg]'], np.zeros(len(gazes))], axis=-1)
+    gazes_cv = TransformationBatch(rotations=Rotation.from_euler('xyz', euler, degrees=True))
+
+    return xyzw_to_wxyz(cv_space_to_qt3d_space(gazes_cv).rotations)
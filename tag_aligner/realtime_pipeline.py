@@ -0,0 +1,288 @@
+import json
+import threading
+import time
+import traceback
+
+import cv2
+import numpy as np
+
+from .maths import (
+    calc_correction,
+    cv_space_to_qt3d_space,
+    rodrigues_to_rotation,
+    Transformation
+)
+
+
+CORNER_COLORS = [
+    (0, 255, 0),
+    (255, 255, 255,),
+    (0, 0, 0,),
+    (0, 0, 255,),
+]
+
+
+class LatestSlot:
+    """
+        A queue with room for one item, where a new item replaces an unread one. A slow
+        consumer then always gets the most recent item instead of falling further and
+        further behind. Replaced items are counted in dropped.
+    """
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.item = None
+        self.has_item = False
+        self.closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self.condition:
+            if self.has_item:
+                self.dropped += 1
+
+            self.item = item
+            self.has_item = True
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        """
+            Waits up to timeout seconds for an item. Returns None if there is none, or
+            if the slot was closed.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.has_item or self.closed, timeout)
+            if not self.has_item:
+                return None
+
+            item = self.item
+            self.item = None
+            self.has_item = False
+
+            return item
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class FileCamera:
+    """
+        Plays a video file like a live camera, for testing without a device. With
+        realtime=True, get_frame waits until the frame is due at the video's frame
+        rate, so slow processing makes frames pile up like it would with a camera.
+    """
+    def __init__(self, video_path, scene_camera_path=None, realtime=True, loop=True):
+        self.cap = cv2.VideoCapture(str(video_path))
+        self.frame_interval = 1.0 / (self.cap.get(cv2.CAP_PROP_FPS) or 30.0)
+        self.realtime = realtime
+        self.loop = loop
+        self.next_frame_time = None
+
+        if scene_camera_path is not None:
+            with open(scene_camera_path, 'r') as scene_camera_file:
+                scene_camera = json.load(scene_camera_file)
+
+            self.camera_matrix = np.array(scene_camera['camera_matrix'])
+            self.camera_distortion = np.array(scene_camera['distortion_coefficients']).reshape(1, -1)
+
+        else:
+            width = self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)
+            height = self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
+            self.camera_matrix = np.array([
+                [1000, 0.0, width/2.0],
+                [0.0, 1000, height/2.0],
+                [0.0, 0.0, 1.0],
+            ])
+            self.camera_distortion = np.array([[ 0.0, 0.0, 0.0, 0.0, 0.0 ]])
+
+    def get_frame(self):
+        if self.realtime:
+            now = time.perf_counter()
+            if self.next_frame_time is None:
+                self.next_frame_time = now
+
+            if self.next_frame_time > now:
+                time.sleep(self.next_frame_time - now)
+
+            # a consumer that was away for longer doesn't get a burst of late frames
+            self.next_frame_time = max(self.next_frame_time + self.frame_interval, now)
+
+        status, frame = self.cap.read()
+        if not status and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            status, frame = self.cap.read()
+
+        return frame if status else None
+
+    def close(self):
+        self.cap.release()
+
+
+class CameraPoseEstimator:
+    """
+        Finds the root tag in a frame and estimates the camera pose from it. Returns a
+        dict with the frame (with the tag corners drawn on it), the tag and camera
+        poses, and the camera pose in Qt3D space. The poses are None if the tag wasn't
+        found.
+    """
+    def __init__(self, detector, root_tag_id, root_tag_size, tag_truth, camera_matrix, camera_distortion):
+        self.detector = detector
+        self.root_tag_id = root_tag_id
+        self.tag_truth = tag_truth
+        self.camera_matrix = camera_matrix
+        self.camera_distortion = camera_distortion
+
+        self.tag_points_3d = np.array([
+            [-root_tag_size/2,  root_tag_size/2, 0], # BL
+            [ root_tag_size/2,  root_tag_size/2, 0], # BR
+            [ root_tag_size/2, -root_tag_size/2, 0], # TL
+            [-root_tag_size/2, -root_tag_size/2, 0], # TR
+        ])
+
+    def __call__(self, frame):
+        result = {
+            'frame': frame,
+            'tag_corners': None,
+            'tag_pose': None,
+            'cam_pose': None,
+            'cam_pose_qt': None,
+        }
+
+        frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        tags = self.detector.detect(frame_gray)
+        for detected_tag in tags:
+            if detected_tag.tag_id != self.root_tag_id:
+                continue
+
+            tag_corners = detected_tag.corners
+
+            ok, (tag_rotation,_), (tag_position,_), (error,_) = cv2.solvePnPGeneric(
+                self.tag_points_3d,
+                tag_corners,
+                self.camera_matrix,
+                self.camera_distortion,
+                flags = cv2.SOLVEPNP_IPPE_SQUARE
+            )
+
+            if not ok:
+                continue
+
+            tag_pose = Transformation(tag_position, rodrigues_to_rotation(tag_rotation))
+
+            correction = calc_correction(tag_pose, self.tag_truth)
+            cam_pose = Transformation().apply(correction)
+
+            result['tag_corners'] = tag_corners
+            result['tag_pose'] = tag_pose
+            result['cam_pose'] = cam_pose
+            result['cam_pose_qt'] = cv_space_to_qt3d_space(cam_pose)
+
+            for corner_idx,corner in enumerate(tag_corners.astype(int)):
+                frame = cv2.circle(frame, corner, 5, CORNER_COLORS[corner_idx], 5)
+
+        return result
+
+
+class DetectionWorker:
+    """
+        Captures frames in one thread and runs process_frame on them in another, so
+        neither blocks the UI. Frames that arrive while the previous one is still being
+        processed replace each other, and so do results the UI hasn't picked up yet.
+
+        on_result is called from the processing thread whenever a result is ready, which
+        can then be fetched with take_result. With Qt, emitting a signal there delivers
+        the notification on the UI thread.
+
+        A frame that process_frame raises on is skipped. The traceback is printed, and
+        on_error is called with the exception from the processing thread.
+    """
+    def __init__(self, camera, process_frame, on_result=None, on_error=None):
+        self.camera = camera
+        self.process_frame = process_frame
+        self.on_result = on_result
+        self.on_error = on_error
+
+        self.frames = LatestSlot()
+        self.results = LatestSlot()
+        self.stop_event = threading.Event()
+        self.threads = []
+
+        self.captured_count = 0
+        self.processed_count = 0
+        self.error_count = 0
+        self.processing_time = 0.0
+
+    def start(self):
+        self.threads = [
+            threading.Thread(target=self._capture, name='capture', daemon=True),
+            threading.Thread(target=self._process, name='detection', daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.frames.close()
+        for thread in self.threads:
+            thread.join()
+
+    def _capture(self):
+        while not self.stop_event.is_set():
+            frame = self.camera.get_frame()
+            if frame is None:
+                time.sleep(0.001)
+                continue
+
+            self.captured_count += 1
+            self.frames.put({
+                'frame': frame,
+                'frame_number': self.captured_count,
+                'captured_at': time.perf_counter(),
+            })
+
+    def _process(self):
+        while not self.stop_event.is_set():
+            captured = self.frames.get(timeout=0.1)
+            if captured is None:
+                continue
+
+            start = time.perf_counter()
+            try:
+                result = self.process_frame(captured['frame'])
+
+            except Exception as error:
+                # one bad frame shouldn't stop detection for good
+                self.error_count += 1
+                traceback.print_exc()
+                if self.on_error is not None:
+                    self.on_error(error)
+
+                continue
+
+            finally:
+                self.processing_time += time.perf_counter() - start
+            self.processed_count += 1
+
+            result['frame_number'] = captured['frame_number']
+            result['captured_at'] = captured['captured_at']
+            self.results.put(result)
+
+            if self.on_result is not None:
+                self.on_result()
+
+    def take_result(self):
+        """
+            The newest result, or None if there is no new one since the last call
+        """
+        return self.results.get(timeout=0)
+
+    def stats(self):
+        return {
+            'captured': self.captured_count,
+            'processed': self.processed_count,
+            'errors': self.error_count,
+            'dropped_before_processing': self.frames.dropped,
+            'dropped_before_display': self.results.dropped,
+            'mean_processing_time': self.processing_time / max(self.processed_count, 1),
+        }
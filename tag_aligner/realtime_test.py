@@ -2,23 +2,21 @@ from PySide6.QtCore import *
 from PySide6.QtWidgets import *
 from PySide6.QtGui import *
 
+import argparse
 import math
+import time
 import cv2
 import numpy as np
 
 from pupil_apriltags import Detector
 from scipy.spatial.transform import Rotation
 
-from pupil_labs.realtime_api.simple import discover_one_device
-
 from .playback import SceneViewerWidget
-from .scaled_image_view import ScaledImageView, qimage_from_frame
+from .scaled_image_view import ScaledImageView
+from .realtime_pipeline import CameraPoseEstimator, DetectionWorker, FileCamera
+from .tracking_detector import TrackingDetector
 
-from .maths import (
-    cv_space_to_qt3d_space,
-    rodrigues_to_rotation,
-    Transformation
-)
+from .maths import Transformation
 
 
 class Webcam:
@@ -42,6 +40,8 @@ class Webcam:
 
 class Neon:
     def __init__(self):
+        from pupil_labs.realtime_api.simple import discover_one_device
+
         print('Attempting device discovery...')
         self.device = discover_one_device()
         print('Connected!')
@@ -81,69 +81,56 @@ class RealtimeWindow(QWidget):
 
 
 
+class DetectionSignals(QObject):
+    # emitted from the detection thread, delivered on the UI thread
+    result_ready = Signal()
+    error = Signal(str)
+
+
 class App(QApplication):
-    def __init__(self):
+    def __init__(self, camera_factory=None, tracking=False):
         super().__init__()
         self.display = RealtimeWindow()
 
-        self.poll_timer = QTimer()
-        self.poll_timer.setInterval(1000//60)
-        self.poll_timer.timeout.connect(self._poll)
-
+        self.camera_factory = camera_factory if camera_factory is not None else Neon
         self.camera = None
-        self.tag_detector = Detector()
+        self.worker = None
+        self.tag_detector = TrackingDetector() if tracking else Detector()
 
         self.root_tag_id = 492
         self.root_tag_size = 0.1730375 # meters
 
-        self.tag_points_3d = np.array([
-            [-self.root_tag_size/2,  self.root_tag_size/2, 0], # BL
-            [ self.root_tag_size/2,  self.root_tag_size/2, 0], # BR
-            [ self.root_tag_size/2, -self.root_tag_size/2, 0], # TL
-            [-self.root_tag_size/2, -self.root_tag_size/2, 0], # TR
-        ])
-
         self.tag_truth = Transformation(
             np.array([0.0, 0.0, 0.0]),
             Rotation.from_quat([-0.707, 0.0, 0.0, 0.707]) # flat on the ground or desk
         )
 
+        self.signals = DetectionSignals()
+        self.signals.result_ready.connect(self._on_result)
+        self.signals.error.connect(self._on_error)
 
-    def _poll(self):
-        frame = self.camera.get_frame()
-        if frame is None:
-            return
-
-        frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        tags = self.tag_detector.detect(frame_gray)
-        for detected_tag in tags:
-            if detected_tag.tag_id != self.root_tag_id:
-                continue
-
-            tag_corners = detected_tag.corners
-
-            ok, (tag_rotation,_), (tag_position,_), (error,_) = cv2.solvePnPGeneric(
-                self.tag_points_3d,
-                tag_corners,
-                self.camera.camera_matrix,
-                self.camera.camera_distortion,
-                flags = cv2.SOLVEPNP_IPPE_SQUARE
-            )
+        self.displayed_count = 0
+        self.latency_total = 0.0
+        self.pose_text = ""
+        self.error_text = ""
 
-            if not ok:
-                continue
+    def _on_error(self, message):
+        self.error_text = f"\nLast detection error: {message}"
+        self.display.debug_info_widget.setText(self.pose_text + self.error_text)
 
-            tag_pose = Transformation(tag_position, rodrigues_to_rotation(tag_rotation))
-            cam_pose = Transformation().relative_to(tag_pose)
-
-            correction = calc_correction(tag_pose, self.tag_truth)
-            cam_pose = Transformation().apply(correction)
+    def _on_result(self):
+        result = self.worker.take_result()
+        if result is None:
+            # an earlier notification already picked this one up
+            return
 
-            cam_pose2 = cv_space_to_qt3d_space(cam_pose)
+        if result['cam_pose_qt'] is not None:
+            cam_pose = result['cam_pose']
+            cam_pose2 = result['cam_pose_qt']
 
-            text = "Tag\n" + pose_to_string(tag_pose)
-            text += "\nCamera\n" + pose_to_string(cam_pose)
-            text += "\nPlayback cam\n" + pose_to_string(cam_pose2)
+            self.pose_text = "Tag\n" + pose_to_string(result['tag_pose'])
+            self.pose_text += "\nCamera\n" + pose_to_string(cam_pose)
+            self.pose_text += "\nPlayback cam\n" + pose_to_string(cam_pose2)
 
             position = QVector3D(*cam_pose2.position)
             x,y,z,w = cam_pose2.rotation.as_quat()
@@ -151,23 +138,40 @@ class App(QApplication):
 
             self.display.scene_widget.set_subject_pose(position, rotation)
 
-            colors = [
-                (0, 255, 0),
-                (255, 255, 255,),
-                (0, 0, 0,),
-                (0, 0, 255,),
-            ]
-            for corner_idx,corner in enumerate(tag_corners.astype(int)):
-                frame = cv2.circle(frame, corner, 5, colors[corner_idx], 5)
-
-            self.display.debug_info_widget.setText(text)
-
         # Display the resulting frame
-        self.display.video_widget.set_image(qimage_from_frame(frame))
+        self.display.video_widget.set_frame(result['frame'])
+
+        self.displayed_count += 1
+        self.latency_total += time.perf_counter() - result['captured_at']
+
+        stats = self.worker.stats()
+        self.display.debug_info_widget.setText(
+            self.pose_text
+            + f"\nLatency {1000 * self.latency_total / self.displayed_count:0.1f} ms"
+            + f", detection {1000 * stats['mean_processing_time']:0.1f} ms"
+            + f"\nFrames {stats['captured']} captured, {stats['processed']} processed, {self.displayed_count} shown"
+            + f", dropped {stats['dropped_before_processing']} before detection, {stats['dropped_before_display']} before display"
+            + self.error_text
+        )
 
     def _start(self):
-        self.camera = Neon()
-        self.poll_timer.start()
+        self.camera = self.camera_factory()
+
+        estimator = CameraPoseEstimator(
+            self.tag_detector,
+            self.root_tag_id,
+            self.root_tag_size,
+            self.tag_truth,
+            self.camera.camera_matrix,
+            self.camera.camera_distortion,
+        )
+        self.worker = DetectionWorker(
+            self.camera,
+            estimator,
+            self.signals.result_ready.emit,
+            lambda error: self.signals.error.emit(f"{type(error).__name__}: {error}"),
+        )
+        self.worker.start()
 
     def exec(self):
         QTimer.singleShot(100, self._start)
@@ -175,15 +179,12 @@ class App(QApplication):
 
         super().exec()
 
-        self.camera.close()
-
+        if self.worker is not None:
+            self.worker.stop()
+            print(self.worker.stats())
 
-def calc_correction(bad, good):
-    good_inv = np.linalg.inv(good.to_matrix())
-    return bad.to_matrix() @ good_inv
+        self.camera.close()
 
-def apply_correction(transform, correction_matrix):
-    return Transformation.from_matrix(np.linalg.inv(correction_matrix) @ transform.to_matrix())
 
 def putText(image, text, position=(10, 30)):
     for line_idx,text in enumerate(text.split('\n')):
@@ -214,5 +215,19 @@ def pose_to_string(pose):
     return f"    {pos_str}\n    {rot_str}\n    {quat_str}"
 
 
-app = App()
-app.exec()
\ No newline at end of file
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--webcam', action='store_true', help='use the first webcam instead of a Neon')
+    parser.add_argument('--video', default=None, help='play a video file as if it were a live camera')
+    parser.add_argument('--scene-camera', default=None, help='scene_camera.json with the intrinsics of --video')
+    parser.add_argument('--tracking', action='store_true', help='only search around where the tag was in the previous frame')
+    args = parser.parse_args()
+
+    camera_factory = Neon
+    if args.webcam:
+        camera_factory = Webcam
+    elif args.video is not None:
+        camera_factory = lambda: FileCamera(args.video, args.scene_camera)
+
+    app = App(camera_factory, args.tracking)
+    app.exec()
\ No newline at end of file
@@ -0,0 +1,95 @@
+import argparse
+import csv
+import json
+
+from pathlib import Path
+
+import numpy as np
+
+from .gaze_files import load_gazes
+from .maths import PoseInterpolator
+from .pose_files import load_aligned_poses
+
+
+RESAMPLED_POSE_FIELDS = [
+    'timestamp [ns]', 'timestamp',
+    'translation_x', 'translation_y', 'translation_z',
+    'rotation_x', 'rotation_y', 'rotation_z', 'rotation_w',
+]
+
+CLOCKS = ['video', 'gaze']
+
+
+def load_clock(recording_path, clock, start_time):
+    """
+        Returns the timestamps of the video frames or gaze samples, in ns and in
+        seconds since the start of the recording
+    """
+    if clock == 'gaze':
+        gazes = load_gazes(recording_path, start_time)
+        return gazes['timestamp [ns]'], gazes['timestamp']
+
+    with (recording_path / 'world_timestamps.csv').open('r') as csv_file:
+        header = next(csv.reader([csv_file.readline()]))
+        timestamps_ns = np.loadtxt(csv_file, delimiter=',', usecols=header.index('timestamp [ns]'), dtype=np.int64, ndmin=1)
+
+    return timestamps_ns, (timestamps_ns - start_time) / 1e9
+
+
+def pose_interpolator(poses, method='linear', max_gap=None, gap='nan'):
+    return PoseInterpolator(
+        (poses['start_timestamp'] + poses['end_timestamp']) / 2,
+        np.stack([poses['translation_x'], poses['translation_y'], poses['translation_z']], axis=-1),
+        np.stack([poses['rotation_x'], poses['rotation_y'], poses['rotation_z'], poses['rotation_w']], axis=-1),
+        method=method,
+        max_gap=max_gap,
+        gap=gap,
+    )
+
+
+def resample_poses(recording_path, clock='video', method='linear', max_gap=None, gap='nan', output_file=None):
+    with (recording_path / 'info.json').open('r') as recording_info_file:
+        start_time = json.load(recording_info_file)['start_time']
+
+    timestamps_ns, timestamps = load_clock(recording_path, clock, start_time)
+    interpolator = pose_interpolator(load_aligned_poses(recording_path), method, max_gap, gap)
+
+    positions, rotations, valid = interpolator(timestamps)
+
+    if output_file is None:
+        output_file = recording_path / f'aligned_poses_{clock}.csv'
+
+    print('Writing', output_file)
+    with output_file.open('w') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(RESAMPLED_POSE_FIELDS)
+        writer.writerows(zip(
+            timestamps_ns.tolist(),
+            timestamps.tolist(),
+            *positions.T.tolist(),
+            *rotations.T.tolist(),
+        ))
+
+    print(f'{np.count_nonzero(valid)} of {len(timestamps)} {clock} timestamps have a pose')
+
+    return positions, rotations, valid
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('recording_path', type=Path)
+    parser.add_argument('--clock', choices=CLOCKS, default='video', help='resample onto the video frames (world_timestamps.csv) or the gaze samples (gaze.csv)')
+    parser.add_argument('--method', choices=PoseInterpolator.METHODS, default='linear', help='position interpolation, rotations always use SLERP')
+    parser.add_argument('--max-gap', type=float, default=None, help='seconds between poses beyond which they are not interpolated')
+    parser.add_argument('--gap', choices=PoseInterpolator.GAP_MODES, default='nan', help='what to output in gaps and outside of the poses')
+    parser.add_argument('--output-file', type=Path, default=None, help='defaults to aligned_poses_CLOCK.csv in the recording')
+    args = parser.parse_args()
+
+    resample_poses(
+        recording_path = args.recording_path,
+        clock = args.clock,
+        method = args.method,
+        max_gap = args.max_gap,
+        gap = args.gap,
+        output_file = args.output_file,
+    )
@@ -2,6 +2,12 @@ from PySide6.QtCore import *
 from PySide6.QtGui import *
 from PySide6.QtWidgets import *
 
+import threading
+import time
+
+import cv2
+import numpy as np
+
 def qimage_from_frame(frame, format=None):
     if frame is None:
         return QImage()
@@ -21,6 +27,114 @@ def qimage_from_frame(frame, format=None):
 
     return QImage(frame.data, width, height, bytes_per_line, image_format)
 
+def fit_size(source_width, source_height, target_width, target_height):
+    """
+        The largest size with the source's aspect ratio that fits into the target
+    """
+    if source_width * target_height > target_width * source_height:
+        return target_width, max(round(source_height * target_width / source_width), 1)
+
+    return max(round(source_width * target_height / source_height), 1), target_height
+
+class FramePresenter(QObject):
+    """
+        Scales frames to their display size on a worker thread, so the UI thread only
+        draws pre-scaled images. submit may be called from any thread. A frame which
+        arrives while the previous one is still being scaled replaces it.
+
+        Each scaled frame is a new array, and is kept together with the QImage which
+        wraps it, so a buffer is never written to while it is displayed. The newest
+        scaled frame waits in a back buffer until the UI thread takes it, after
+        frame_ready.
+    """
+    frame_ready = Signal()
+
+    def __init__(self, interpolation=cv2.INTER_LINEAR):
+        super().__init__()
+
+        self.interpolation = interpolation
+        self.condition = threading.Condition()
+        self.target_size = None
+        self.pending_frame = None
+        self.last_frame = None
+        self.back_buffer = None
+        self.stopped = False
+
+        self.submitted_count = 0
+        self.scaled_count = 0
+        self.dropped_count = 0
+        self.scaling_time = 0.0
+
+        self.thread = threading.Thread(target=self._run, name='frame scaling', daemon=True)
+        self.thread.start()
+
+    def submit(self, frame):
+        with self.condition:
+            if self.pending_frame is not None:
+                self.dropped_count += 1
+
+            self.pending_frame = frame
+            self.submitted_count += 1
+            self.condition.notify()
+
+    def set_target_size(self, width, height):
+        with self.condition:
+            if self.target_size == (width, height):
+                return
+
+            self.target_size = (width, height)
+
+            # the last frame is scaled again for the new size, unless a new one is coming anyway
+            if self.pending_frame is None and self.last_frame is not None:
+                self.pending_frame = self.last_frame
+                self.condition.notify()
+
+    def take(self):
+        """
+            The newest (array, QImage) pair, or None if there is none since the last call
+        """
+        with self.condition:
+            buffer = self.back_buffer
+            self.back_buffer = None
+
+            return buffer
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending_frame is not None or self.stopped)
+                if self.stopped:
+                    return
+
+                frame = self.pending_frame
+                self.pending_frame = None
+                self.last_frame = frame
+                target_size = self.target_size
+
+            start = time.perf_counter()
+            height, width = frame.shape[:2]
+            if target_size is not None and target_size[0] > 0 and target_size[1] > 0:
+                size = fit_size(width, height, *target_size)
+                if size != (width, height):
+                    frame = cv2.resize(frame, size, interpolation=self.interpolation)
+
+            frame = np.ascontiguousarray(frame)
+            image = qimage_from_frame(frame)
+            self.scaling_time += time.perf_counter() - start
+
+            with self.condition:
+                self.back_buffer = (frame, image)
+                self.scaled_count += 1
+
+            self.frame_ready.emit()
+
 class ScaledImageView(QWidget):
     def __init__(self):
         super().__init__()
@@ -31,9 +145,39 @@ class ScaledImageView(QWidget):
         self.setMinimumSize(32, 32)
         self.last_image_size = None
 
+        # only started by the first set_frame, views fed with set_image don't need it
+        self.presenter = None
+        self.presenter_lock = threading.Lock()
+        self.front_buffer = None
+
     def resizeEvent(self, event):
         self.update_rect()
 
+        if self.presenter is not None:
+            self.presenter.set_target_size(self.width() - self.margin*2, self.height() - self.margin*2)
+
+    def closeEvent(self, event):
+        self.stop_presenter()
+        super().closeEvent(event)
+
+    def start_presenter(self):
+        presenter = FramePresenter()
+        presenter.set_target_size(self.width() - self.margin*2, self.height() - self.margin*2)
+        presenter.frame_ready.connect(self._on_frame_ready, Qt.QueuedConnection)
+
+        # views which are deleted without being closed stop the thread too
+        self.destroyed.connect(lambda: presenter.stop())
+
+        self.presenter = presenter
+
+    def stop_presenter(self):
+        with self.presenter_lock:
+            presenter = self.presenter
+            self.presenter = None
+
+        if presenter is not None:
+            presenter.stop()
+
     def update_rect(self):
         if self.image is None:
             return
@@ -48,11 +192,37 @@ class ScaledImageView(QWidget):
             return
 
         if isinstance(self.image , QImage):
-            painter.drawImage(self.render_rect, self.image)
+            if self.render_rect.size() == self.image.size():
+                # pre-scaled by the presenter
+                painter.drawImage(self.render_rect.topLeft(), self.image)
+            else:
+                painter.drawImage(self.render_rect, self.image)
 
         elif isinstance(self.image, QPixmap):
             painter.drawPixmap(self.render_rect, self.image)
 
+    def set_frame(self, frame):
+        """
+            Shows a BGR or grayscale frame, scaled to fit on a worker thread. Unlike
+            set_image, this may be called from any thread.
+        """
+        with self.presenter_lock:
+            if self.presenter is None:
+                self.start_presenter()
+
+            self.presenter.submit(frame)
+
+    def _on_frame_ready(self):
+        presenter = self.presenter
+        buffer = None if presenter is None else presenter.take()
+        if buffer is None:
+            # an earlier notification already showed the newest frame, nothing to repaint
+            return
+
+        # keeps the array alive as long as its QImage is displayed
+        self.front_buffer = buffer
+        self.set_image(buffer[1])
+
     def set_image(self, image):
         self.image = image
 
@@ -69,22 +239,14 @@ class ScaledImageView(QWidget):
         if source_size.height() == 0:
             return QRect(0, 0, 1, 1)
 
-        source_ratio = source_size.width() / source_size.height()
-        target_ratio = self.width() / self.height()
-
-        resultSize = QSize()
-
-        if source_ratio > target_ratio:
-            resultSize.setWidth(self.width() - self.margin*2)
-            resultSize.setHeight(source_size.height() * (resultSize.width() / source_size.width()))
-
-        else:
-            resultSize.setHeight(self.height() - self.margin*2)
-            resultSize.setWidth(source_size.width() * (resultSize.height() / source_size.height()))
+        width, height = fit_size(
+            source_size.width(), source_size.height(),
+            self.width() - self.margin*2, self.height() - self.margin*2,
+        )
 
         resultPos = QPoint(
-            (self.width() - resultSize.width()) / 2.0,
-            (self.height() - resultSize.height()) / 2.0
+            (self.width() - width) // 2,
+            (self.height() - height) // 2
         )
 
-        return QRect(resultPos, resultSize)
+        return QRect(resultPos, QSize(width, height))
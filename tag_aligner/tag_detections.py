@@ -0,0 +1,172 @@
+import hashlib
+import json
+
+import cv2
+import numpy as np
+
+
+# Matches the defaults of pupil_apriltags.Detector
+DETECTOR_PARAMS = {
+    "families": "tag36h11",
+    "nthreads": 1,
+    "quad_decimate": 2.0,
+    "quad_sigma": 0.0,
+    "refine_edges": 1,
+    "decode_sharpening": 0.25,
+    "debug": 0,
+}
+
+# These don't change what the detector finds
+_UNKEYED_DETECTOR_PARAMS = ["nthreads", "debug"]
+
+CACHE_FILE_NAME = "tag_detections.npz"
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def empty_detections():
+    """
+        Detections are stored column-wise, one row per detected tag, sorted by frame.
+        processed_frames lists every frame that went through the detector, including
+        those in which no tag was found.
+    """
+    return {
+        "processed_frames": np.zeros(0, dtype=np.int64),
+        "frame_idx": np.zeros(0, dtype=np.int64),
+        "timestamp": np.zeros(0, dtype=np.float64),
+        "tag_id": np.zeros(0, dtype=np.int32),
+        "corners": np.zeros((0, 4, 2), dtype=np.float64),
+        "hamming": np.zeros(0, dtype=np.int32),
+        "decision_margin": np.zeros(0, dtype=np.float64),
+    }
+
+
+def detections_from_tags(frame_idx, timestamp, detected_tags):
+    return {
+        "processed_frames": np.array([frame_idx], dtype=np.int64),
+        "frame_idx": np.full(len(detected_tags), frame_idx, dtype=np.int64),
+        "timestamp": np.full(len(detected_tags), timestamp, dtype=np.float64),
+        "tag_id": np.array([tag.tag_id for tag in detected_tags], dtype=np.int32),
+        "corners": np.array([tag.corners for tag in detected_tags], dtype=np.float64).reshape(-1, 4, 2),
+        "hamming": np.array([tag.hamming for tag in detected_tags], dtype=np.int32),
+        "decision_margin": np.array([tag.decision_margin for tag in detected_tags], dtype=np.float64),
+    }
+
+
+def subpixel_corners(frame_gray, corners):
+    """
+        Refines the 4 corners of a detected tag with cv2.cornerSubPix
+    """
+    # the search window has to stay well inside the tag's border cells
+    side = np.min(np.linalg.norm(corners - np.roll(corners, 1, axis=0), axis=1))
+    window = int(np.clip(side / 16, 2, 5))
+
+    refined = cv2.cornerSubPix(
+        frame_gray,
+        corners.astype(np.float32).reshape(-1, 1, 2),
+        (window, window),
+        (-1, -1),
+        (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_COUNT, 20, 0.01),
+    )
+
+    return refined.reshape(-1, 2).astype(np.float64)
+
+
+def merge_detections(detections_list):
+    merged = {
+        field: np.concatenate([detections[field] for detections in detections_list])
+        for field in empty_detections()
+    }
+
+    # stable, so tags keep the detector's order within a frame
+    order = np.argsort(merged["frame_idx"], kind="stable")
+    for field in merged:
+        if field != "processed_frames":
+            merged[field] = merged[field][order]
+
+    merged["processed_frames"] = np.unique(merged["processed_frames"])
+
+    return merged
+
+
+def select_frames(detections, frame_indices):
+    selected = {
+        field: values[np.isin(detections["frame_idx"], frame_indices)]
+        for field, values in detections.items()
+        if field != "processed_frames"
+    }
+    selected["processed_frames"] = np.intersect1d(detections["processed_frames"], frame_indices)
+
+    return selected
+
+
+def video_hash(video_path, previous=None):
+    """
+        Content hash of the video. Hashing a long recording takes a while, so the
+        hash stored in a previous cache is reused if the file's size and
+        modification time are unchanged.
+    """
+    stat = video_path.stat()
+    signature = f"{stat.st_size}:{stat.st_mtime_ns}"
+
+    if previous is not None and previous["signature"] == signature:
+        return previous
+
+    digest = hashlib.sha256()
+    with video_path.open("rb") as video_file:
+        while chunk := video_file.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+
+    return {"signature": signature, "digest": digest.hexdigest()}
+
+
+def cache_key(video_digest, detector_params, refine_corners=False, decoder_params=None):
+    keyed_params = {k: v for k, v in detector_params.items() if k not in _UNKEYED_DETECTOR_PARAMS}
+
+    # only added when not the default, so caches written before stay valid
+    if refine_corners:
+        keyed_params["refine_corners"] = True
+
+    if decoder_params is not None:
+        keyed_params["decoder"] = decoder_params
+
+    return hashlib.sha256(f"{video_digest}:{json.dumps(keyed_params, sort_keys=True)}".encode()).hexdigest()
+
+
+def load_cache(cache_path):
+    """
+        Returns the stored video hash, cache key and detections, or None if
+        there is no readable cache
+    """
+    if not cache_path.exists():
+        return None
+
+    try:
+        with np.load(cache_path, allow_pickle=False) as cache:
+            detections = {field: cache[field] for field in empty_detections()}
+            hash_info = {
+                "signature": str(cache["video_signature"]),
+                "digest": str(cache["video_digest"]),
+            }
+            key = str(cache["cache_key"])
+
+    except (OSError, KeyError, ValueError) as error:
+        print("Ignoring unreadable detection cache", cache_path, error)
+        return None
+
+    return hash_info, key, detections
+
+
+def save_cache(cache_path, hash_info, key, detections):
+    # write next to the target and rename so an interrupted run can't leave a truncated cache
+    temp_path = cache_path.with_name(cache_path.name + ".tmp")
+    with temp_path.open("wb") as cache_file:
+        np.savez_compressed(
+            cache_file,
+            video_signature=hash_info["signature"],
+            video_digest=hash_info["digest"],
+            cache_key=key,
+            **detections
+        )
+
+    temp_path.replace(cache_path)
@@ -0,0 +1,131 @@
+import numpy as np
+
+
+class TimestampIndex:
+    """
+        Finds samples by time in sorted timestamp columns. A sample is either a point
+        in time, or an interval from start to end (like a pose), whose midpoint is used
+        for nearest lookups.
+
+        Single lookups remember where the last one ended up. Playback asks for slowly
+        increasing times, which are then found by checking the next few samples rather
+        than searching the whole column. Repeating the last lookup, as both playback
+        widgets do for every video position, returns the stored result.
+    """
+    # how far a single lookup walks from the previous one before searching instead
+    MAX_STEPS = 4
+
+    def __init__(self, start_timestamps, end_timestamps=None):
+        self.start = np.asarray(start_timestamps, dtype=np.float64)
+        if end_timestamps is None:
+            self.end = self.start
+            self.midpoints = self.start
+        else:
+            self.end = np.asarray(end_timestamps, dtype=np.float64)
+            self.midpoints = (self.start + self.end) / 2
+
+        self.position = 0
+        self.last_query = None
+        self.last_result = None
+
+    def __len__(self):
+        return len(self.start)
+
+    def _insertion_point(self, timestamp):
+        """
+            Same as np.searchsorted(self.midpoints, timestamp), but starting from the
+            previous lookup
+        """
+        midpoints = self.midpoints
+        position = self.position
+        if 0 < position <= len(midpoints) and midpoints.item(position-1) < timestamp:
+            for _ in range(self.MAX_STEPS):
+                if position == len(midpoints) or timestamp <= midpoints.item(position):
+                    self.position = position
+                    return position
+
+                position += 1
+
+        self.position = int(midpoints.searchsorted(timestamp))
+        return self.position
+
+    def nearest(self, timestamp, threshold=None):
+        """
+            Index of the sample closest to timestamp, or None if there are no samples or
+            the closest one is more than threshold away
+        """
+        query = ('nearest', timestamp, threshold)
+        if query == self.last_query:
+            return self.last_result
+
+        midpoints = self.midpoints
+        result = None
+        if len(midpoints) > 0:
+            position = self._insertion_point(timestamp)
+            if position == len(midpoints):
+                result = position - 1
+            elif position == 0:
+                result = 0
+            elif timestamp - midpoints.item(position-1) <= midpoints.item(position) - timestamp:
+                result = position - 1
+            else:
+                result = position
+
+            if threshold is not None and abs(timestamp - midpoints.item(result)) > threshold:
+                result = None
+
+        self.last_query, self.last_result = query, result
+        return result
+
+    def containing(self, timestamp, tolerance=0.0):
+        """
+            Index of the last interval with start - tolerance <= timestamp <= end + tolerance,
+            or None if there is no such interval
+        """
+        position = int(self.start.searchsorted(timestamp + tolerance, side='right')) - 1
+        if position < 0 or timestamp > self.end.item(position) + tolerance:
+            return None
+
+        return position
+
+    def nearest_many(self, timestamps, threshold=None):
+        """
+            Vectorized nearest(), with -1 wherever it would return None
+        """
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        if len(self.midpoints) == 0:
+            return np.full(timestamps.shape, -1, dtype=np.int64)
+
+        positions = np.searchsorted(self.midpoints, timestamps)
+        before = np.maximum(positions - 1, 0)
+        after = np.minimum(positions, len(self.midpoints) - 1)
+        use_before = (positions == len(self.midpoints)) | (
+            (positions > 0) & (timestamps - self.midpoints[before] <= self.midpoints[after] - timestamps)
+        )
+        indices = np.where(use_before, before, after).astype(np.int64)
+
+        if threshold is not None:
+            indices[np.abs(timestamps - self.midpoints[indices]) > threshold] = -1
+
+        return indices
+
+    def containing_many(self, timestamps, tolerance=0.0):
+        """
+            Vectorized containing(), with -1 wherever it would return None
+        """
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        indices = np.searchsorted(self.start, timestamps + tolerance, side='right').astype(np.int64) - 1
+        found = indices >= 0
+        found[found] = timestamps[found] <= self.end[indices[found]] + tolerance
+        indices[~found] = -1
+
+        return indices
+
+    def between(self, start_timestamp, end_timestamp):
+        """
+            Slice of the samples whose midpoints are in [start_timestamp, end_timestamp)
+        """
+        return slice(
+            int(np.searchsorted(self.midpoints, start_timestamp)),
+            int(np.searchsorted(self.midpoints, end_timestamp)),
+        )
@@ -0,0 +1,121 @@
+from collections import namedtuple
+
+import numpy as np
+
+from pupil_apriltags import Detector
+
+from .tag_detections import subpixel_corners
+
+
+# Same fields as the pupil_apriltags detections the rest of the code uses
+TagDetection = namedtuple('TagDetection', ['tag_id', 'corners', 'center', 'hamming', 'decision_margin'])
+
+
+class TrackingDetector:
+    """
+        A drop-in for Detector.detect on consecutive video frames. Tags are first found
+        on the whole frame with a coarse quad_decimate, or if that finds none, with the
+        finer tracking decimation, which also picks up small or distant tags. After that,
+        each tag is only searched for in a region around where it was in the previous
+        frame, with the finer decimation. If a tracked tag is lost, or every
+        reacquire_interval frames to pick up new tags, the whole frame is searched again.
+
+        The detector's refine_edges fits the tag edges on the full resolution frame
+        whatever the decimation. With refine_corners, the corners are additionally
+        refined with cv2.cornerSubPix.
+    """
+    def __init__(
+        self,
+        families='tag36h11',
+        acquire_decimate=4.0,
+        track_decimate=2.0,
+        roi_margin=0.5,
+        min_roi_size=64,
+        reacquire_interval=10,
+        refine_corners=False,
+        nthreads=1,
+    ):
+        self.track_detector = Detector(families=families, quad_decimate=track_decimate, nthreads=nthreads)
+        if acquire_decimate == track_decimate:
+            self.acquire_detector = self.track_detector
+        else:
+            self.acquire_detector = Detector(families=families, quad_decimate=acquire_decimate, nthreads=nthreads)
+
+        self.roi_margin = roi_margin
+        self.min_roi_size = min_roi_size
+        self.reacquire_interval = reacquire_interval
+        self.refine_corners = refine_corners
+
+        self.tracked = {}
+        self.frames_since_acquisition = 0
+
+        self.acquisition_count = 0
+        self.tracking_count = 0
+
+    def reset(self):
+        self.tracked = {}
+
+    def roi(self, corners, frame_shape):
+        """
+            The region around a tag's last corners, as (x0, y0, x1, y1)
+        """
+        low = corners.min(axis=0)
+        high = corners.max(axis=0)
+        margin = np.maximum((high - low) * self.roi_margin, self.min_roi_size / 2)
+
+        x0, y0 = np.floor(low - margin).astype(int)
+        x1, y1 = np.ceil(high + margin).astype(int)
+
+        return max(x0, 0), max(y0, 0), min(x1, frame_shape[1]), min(y1, frame_shape[0])
+
+    def detect_in_roi(self, frame_gray, tag_id, roi):
+        x0, y0, x1, y1 = roi
+        if x1 - x0 < 8 or y1 - y0 < 8:
+            return None
+
+        crop = np.ascontiguousarray(frame_gray[y0:y1, x0:x1])
+        for tag in self.track_detector.detect(crop):
+            if tag.tag_id == tag_id:
+                offset = np.array([x0, y0], dtype=np.float64)
+                return TagDetection(tag.tag_id, tag.corners + offset, tag.center + offset, tag.hamming, tag.decision_margin)
+
+        return None
+
+    def acquire(self, frame_gray):
+        self.acquisition_count += 1
+        self.frames_since_acquisition = 0
+
+        tags = self.acquire_detector.detect(frame_gray)
+        if not tags and self.acquire_detector is not self.track_detector:
+            tags = self.track_detector.detect(frame_gray)
+
+        return [TagDetection(tag.tag_id, tag.corners, tag.center, tag.hamming, tag.decision_margin) for tag in tags]
+
+    def refine(self, frame_gray, tags):
+        return [tag._replace(corners=subpixel_corners(frame_gray, tag.corners)) for tag in tags]
+
+    def detect(self, frame_gray):
+        self.frames_since_acquisition += 1
+
+        tags = None
+        if self.tracked and self.frames_since_acquisition < self.reacquire_interval:
+            self.tracking_count += 1
+            tags = []
+            for tag_id, corners in self.tracked.items():
+                tag = self.detect_in_roi(frame_gray, tag_id, self.roi(corners, frame_gray.shape))
+                if tag is None:
+                    # lost, so search everything in this frame already
+                    tags = None
+                    break
+
+                tags.append(tag)
+
+        if tags is None:
+            tags = self.acquire(frame_gray)
+
+        if self.refine_corners:
+            tags = self.refine(frame_gray, tags)
+
+        self.tracked = {tag.tag_id: tag.corners for tag in tags}
+
+        return tags
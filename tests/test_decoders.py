@@ -0,0 +1,94 @@
+"""
+    The decoder backends against decord, on a generated video where every frame
+    looks different. The pyav tests are skipped if the av package isn't installed.
+
+    python -m pytest tests
+"""
+import cv2
+import numpy as np
+import pytest
+
+import decord
+
+from tag_aligner.decoders import SEEK_DISTANCE, VideoDecoder, open_video
+
+
+FRAME_COUNT = 150
+
+# ascending, with short steps that are decoded through and long jumps that seek
+FRAME_INDICES = np.array([0, 1, 2, 5, 9, 10, 11, 40, 41, 43, 44 + SEEK_DISTANCE + 1, 100, 101, 149])
+
+
+@pytest.fixture(scope="module")
+def video_path(tmp_path_factory):
+    video_path = tmp_path_factory.mktemp("video") / "scene.mp4"
+    writer = cv2.VideoWriter(str(video_path), cv2.VideoWriter_fourcc(*"mp4v"), 30.0, (160, 120))
+
+    rng = np.random.default_rng(0)
+    for _ in range(FRAME_COUNT):
+        # blocks big enough to survive compression
+        blocks = rng.integers(0, 256, size=(12, 16), dtype=np.uint8)
+        frame = cv2.resize(blocks, (160, 120), interpolation=cv2.INTER_NEAREST)
+        writer.write(cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR))
+
+    writer.release()
+
+    return video_path
+
+
+@pytest.fixture(scope="module")
+def reference(video_path):
+    """
+        Every frame decoded by decord, and the frame timestamps
+    """
+    video_reader = decord.VideoReader(str(video_path), ctx=decord.cpu(0))
+    frame_times = video_reader.get_frame_timestamp(np.arange(len(video_reader)))[:, 0]
+    frames = video_reader.get_batch(list(range(len(video_reader)))).asnumpy()
+
+    return np.array([cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY) for frame in frames], dtype=np.float32), frame_times
+
+
+def assert_same_frames(video, reference):
+    reference_frames, frame_times = reference
+    decoded = list(video.read_gray(FRAME_INDICES, frame_times[FRAME_INDICES]))
+    video.close()
+
+    assert [frame_idx for frame_idx, _ in decoded] == FRAME_INDICES.tolist()
+    for frame_idx, frame_gray in decoded:
+        differences = np.mean(np.abs(reference_frames - frame_gray), axis=(1, 2))
+
+        # luma and color conversions differ a little, but no other frame comes close
+        assert np.argmin(differences) == frame_idx
+        assert differences[frame_idx] < np.partition(differences, 1)[1] / 4
+
+
+def test_the_frame_count_matches(reference):
+    assert len(reference[1]) == FRAME_COUNT
+
+
+@pytest.mark.parametrize("backend", ["decord", "opencv", "pyav"])
+def test_backends_decode_the_requested_frames(video_path, reference, backend):
+    if backend == "pyav":
+        pytest.importorskip("av")
+
+    assert_same_frames(open_video(video_path, backend), reference)
+
+
+def test_pyav_seeks_to_the_requested_frames_when_scaled(video_path, reference):
+    pytest.importorskip("av")
+
+    video = open_video(video_path, "pyav", scale=0.5)
+    frame_times = reference[1]
+    for frame_idx, frame_gray in video.read_gray(FRAME_INDICES, frame_times[FRAME_INDICES]):
+        assert frame_gray.shape == (60, 80)
+
+    video.close()
+
+
+def test_incomplete_backends_fail_when_constructed(video_path):
+    class WithoutClose(VideoDecoder):
+        def read_gray(self, frame_indices, frame_times):
+            yield from []
+
+    with pytest.raises(TypeError):
+        WithoutClose(video_path)
@@ -0,0 +1,103 @@
+"""
+    DetectionWorker fed by a FileCamera, without a display
+
+    python -m pytest tests
+"""
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from tag_aligner.realtime_pipeline import DetectionWorker, FileCamera
+
+
+FRAME_COUNT = 60
+
+
+@pytest.fixture
+def video_path(tmp_path):
+    video_path = tmp_path / "scene.avi"
+    writer = cv2.VideoWriter(str(video_path), cv2.VideoWriter_fourcc(*"MJPG"), 30.0, (160, 120))
+    for frame_idx in range(FRAME_COUNT):
+        writer.write(np.full((120, 160, 3), frame_idx * 4, dtype=np.uint8))
+
+    writer.release()
+
+    return video_path
+
+
+def run_worker(camera, process_frame, result_count, timeout=10.0):
+    """
+        Collects results like the UI does, from on_result, until result_count arrived
+    """
+    results = []
+    errors = []
+    done = threading.Event()
+
+    def on_result():
+        result = worker.take_result()
+        if result is not None:
+            results.append(result)
+
+        if len(results) >= result_count:
+            done.set()
+
+    worker = DetectionWorker(camera, process_frame, on_result, errors.append)
+    worker.start()
+    try:
+        assert done.wait(timeout), f"only {len(results)} results in {timeout} s"
+    finally:
+        worker.stop()
+        camera.close()
+
+    return worker, results, errors
+
+
+def mean_brightness(frame):
+    return {"brightness": float(frame.mean())}
+
+
+def test_results_carry_increasing_frame_numbers(video_path):
+    worker, results, errors = run_worker(FileCamera(video_path, realtime=True), mean_brightness, 20)
+
+    frame_numbers = [result["frame_number"] for result in results]
+    assert frame_numbers == sorted(set(frame_numbers))
+    assert frame_numbers[0] >= 1
+    assert not errors
+
+    stats = worker.stats()
+    assert stats["processed"] >= len(results)
+    assert stats["captured"] >= frame_numbers[-1]
+
+
+def test_slow_processing_drops_frames(video_path):
+    def slow_brightness(frame):
+        time.sleep(0.05)
+        return mean_brightness(frame)
+
+    worker, results, errors = run_worker(FileCamera(video_path, realtime=False), slow_brightness, 5)
+
+    frame_numbers = [result["frame_number"] for result in results]
+    assert frame_numbers == sorted(set(frame_numbers))
+    assert worker.stats()["dropped_before_processing"] > 0
+
+
+def test_errors_are_reported_and_skipped(video_path):
+    calls = 0
+
+    def failing_brightness(frame):
+        nonlocal calls
+        calls += 1
+        if calls % 3 == 0:
+            raise cv2.error("malformed frame")
+
+        return mean_brightness(frame)
+
+    worker, results, errors = run_worker(FileCamera(video_path, realtime=True), failing_brightness, 10)
+
+    frame_numbers = [result["frame_number"] for result in results]
+    assert frame_numbers == sorted(set(frame_numbers))
+    assert errors and all(isinstance(error, cv2.error) for error in errors)
+    assert worker.stats()["errors"] == len(errors)
@@ -0,0 +1,154 @@
+"""
+    Resumed downloads against downloader.mock_cloud
+
+    python -m pytest tests
+"""
+import collections
+import os
+import threading
+
+import pytest
+
+from downloader.cloud_api import CloudAPI
+from downloader.mock_cloud import MockCloudHandler, MockCloudServer
+
+
+EXPORT_PATH = "/workspaces/ws/recordings:raw-data-export?ids=rec1"
+
+
+class RecordingHandler(MockCloudHandler):
+    def log_request(self, code="-", size="-"):
+        self.server.statuses[self.path.split("?")[0].rpartition("/")[2]].append(int(code))
+
+
+@pytest.fixture
+def server(tmp_path):
+    recording_path = tmp_path / "cloud" / "rec1"
+    recording_path.mkdir(parents=True)
+    (recording_path / "scene.mp4").write_bytes(os.urandom(3 * 1024 * 1024))
+    (recording_path / "info.json").write_text('{"start_time": 0}')
+
+    server = MockCloudServer(tmp_path / "cloud")
+    server.RequestHandlerClass = RecordingHandler
+    server.statuses = collections.defaultdict(list)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+def export_statuses(server):
+    return server.statuses["recordings:raw-data-export"]
+
+
+def export_bytes(server):
+    return server.export(server.root / "rec1").read_bytes()
+
+
+def export_etag(server):
+    export_stat = server.export(server.root / "rec1").stat()
+    return f'"{export_stat.st_size}-{export_stat.st_mtime_ns}"'
+
+
+def leave_part(save_path, data, validator=None):
+    save_path.with_name(save_path.name + ".part").write_bytes(data)
+    if validator is not None:
+        save_path.with_name(save_path.name + ".part.validator").write_text(validator)
+
+
+def assert_complete(save_path, expected):
+    assert save_path.read_bytes() == expected
+    assert not save_path.with_name(save_path.name + ".part").exists()
+    assert not save_path.with_name(save_path.name + ".part.validator").exists()
+
+
+def test_download(server, tmp_path):
+    save_path = tmp_path / "rec1.zip"
+    CloudAPI("key", server.api_url).download_url(EXPORT_PATH, save_path)
+
+    assert_complete(save_path, export_bytes(server))
+    assert export_statuses(server) == [200]
+
+
+def test_truncated_download_is_resumed(server, tmp_path):
+    expected = export_bytes(server)
+    save_path = tmp_path / "rec1.zip"
+    leave_part(save_path, expected[:len(expected) // 2], export_etag(server))
+
+    CloudAPI("key", server.api_url).download_url(EXPORT_PATH, save_path)
+
+    assert_complete(save_path, expected)
+    assert export_statuses(server) == [206]
+
+
+def test_complete_part_gets_416(server, tmp_path):
+    expected = export_bytes(server)
+    save_path = tmp_path / "rec1.zip"
+    leave_part(save_path, expected, export_etag(server))
+
+    CloudAPI("key", server.api_url).download_url(EXPORT_PATH, save_path)
+
+    assert_complete(save_path, expected)
+    assert export_statuses(server) == [416]
+
+
+def test_changed_export_starts_over(server, tmp_path):
+    old_export = export_bytes(server)
+    save_path = tmp_path / "rec1.zip"
+    leave_part(save_path, old_export[:len(old_export) // 2], export_etag(server))
+
+    # regenerates the export with different content
+    (server.root / "rec1" / "scene.mp4").write_bytes(os.urandom(2 * 1024 * 1024))
+    new_export = export_bytes(server)
+
+    CloudAPI("key", server.api_url).download_url(EXPORT_PATH, save_path)
+
+    assert_complete(save_path, new_export)
+    assert export_statuses(server) == [200]
+
+
+def test_part_without_validator_starts_over(server, tmp_path):
+    expected = export_bytes(server)
+    save_path = tmp_path / "rec1.zip"
+    leave_part(save_path, b"not the export")
+
+    CloudAPI("key", server.api_url).download_url(EXPORT_PATH, save_path)
+
+    assert_complete(save_path, expected)
+    assert export_statuses(server) == [200]
+
+
+def test_interrupted_download_is_resumed(server, tmp_path):
+    expected = export_bytes(server)
+    save_path = tmp_path / "rec1.zip"
+
+    class Interrupted(Exception):
+        pass
+
+    class InterruptingProgress:
+        """
+            Stands in for a shared tqdm, and aborts the download after the first chunk
+        """
+        total = None
+
+        def get_lock(self):
+            return threading.Lock()
+
+        def refresh(self):
+            pass
+
+        def update(self, count):
+            raise Interrupted()
+
+    api = CloudAPI("key", server.api_url)
+    with pytest.raises(Interrupted):
+        api.download_url(EXPORT_PATH, save_path, chunk_size=1024 * 1024, progress=InterruptingProgress())
+
+    assert save_path.with_name(save_path.name + ".part").stat().st_size == 1024 * 1024
+
+    api.download_url(EXPORT_PATH, save_path)
+
+    assert_complete(save_path, expected)
+    assert export_statuses(server) == [200, 206]
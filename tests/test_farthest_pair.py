@@ -0,0 +1,66 @@
+"""
+    find_farthest_pair against a scan over all pairs
+
+    python -m pytest tests
+"""
+import numpy as np
+
+from tag_aligner.maths import find_farthest_pair
+
+
+def farthest_distance(points):
+    distances = np.linalg.norm(points[:, np.newaxis] - points[np.newaxis], axis=-1)
+    return np.max(distances)
+
+
+def pair_distance(points, pair):
+    a, b = pair
+    return np.linalg.norm(points[a] - points[b])
+
+
+def random_rotation(rng):
+    rotation, _ = np.linalg.qr(rng.normal(size=(3, 3)))
+    return rotation
+
+
+def test_matches_all_pairs():
+    rng = np.random.default_rng(0)
+    points = rng.normal(size=(500, 3))
+
+    assert np.isclose(pair_distance(points, find_farthest_pair(points)), farthest_distance(points))
+
+
+def test_planar_points_match_all_pairs():
+    rng = np.random.default_rng(1)
+    points = np.column_stack([rng.normal(size=(500, 2)), np.zeros(500)]) @ random_rotation(rng) + 3.0
+
+    assert np.isclose(pair_distance(points, find_farthest_pair(points)), farthest_distance(points))
+
+
+def test_collinear_points():
+    rng = np.random.default_rng(2)
+    points = np.outer(rng.uniform(-1.0, 1.0, size=500), [1.0, 2.0, 3.0])
+    points[123] = [-2.0, -4.0, -6.0]
+    points[321] = [3.0, 6.0, 9.0]
+
+    assert find_farthest_pair(points) == (123, 321)
+
+
+def test_large_floor_trajectory():
+    # a tag-only recording on the floor keeps the height constant
+    rng = np.random.default_rng(3)
+    points = np.column_stack([rng.uniform(-5.0, 5.0, size=(20000, 2)), np.full(20000, 1.6)])
+    points[4567] = [-6.0, -6.0, 1.6]
+    points[15678] = [6.0, 6.0, 1.6]
+
+    assert find_farthest_pair(points) == (4567, 15678)
+
+
+def test_ties_resolve_to_the_first_pair():
+    points = np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [1.0, 1.0, 0.0]])
+
+    assert find_farthest_pair(points) == (0, 3)
+
+
+def test_identical_points():
+    assert find_farthest_pair(np.ones((20, 3))) == (None, None)